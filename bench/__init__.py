@@ -0,0 +1 @@
+# bench — banc de charge hors-ligne (faux Telegram + faux Sheets), voir bench/run.py
@@ -0,0 +1,131 @@
+# bench/fake_sheets.py — remplaçant en mémoire de gspread (latence et erreurs simulées)
+import re, time, random, threading, json
+
+HEADER = ["id", "name", "price_cents", "sizes", "category", "image_url", "stock",
+          "colors", "image_color_map_json", "active", "updated_at"]
+COLORS = ["Noir", "Blanc", "Rouge", "Bleu", "Vert", "Beige"]
+
+def make_products(n: int, categories: int = 6, image_base: str = "") -> list[list]:
+    rows = []
+    for i in range(1, n + 1):
+        colors = COLORS[: 1 + i % len(COLORS)]
+        cmap = {c: f"{image_base}/img/{i}-{k}.jpg" for k, c in enumerate(colors)} if image_base else {}
+        rows.append([
+            str(i), f"Modèle {i}", str(4999 + i), "38-45", f"Catégorie {i % categories}",
+            f"{image_base}/img/{i}.jpg" if image_base else "", "10",
+            ", ".join(colors), json.dumps(cmap), "1", "2024-01-01T00:00:00",
+        ])
+    return rows
+
+class FakeSheetsError(Exception):
+    pass
+
+def _col_index(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + (ord(ch) - 64)
+    return n
+
+_RX_A1 = re.compile(r"^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$")
+
+class FakeWorksheet:
+    def __init__(self, sheet: "FakeSpreadsheet", title: str, values: list[list]):
+        self.sheet = sheet
+        self.title = title
+        self.values = values
+
+    def _call(self, kind: str):
+        self.sheet._call(kind)
+
+    def _range(self, a1: str) -> list[list]:
+        a1 = a1.split("!", 1)[-1]
+        c1, r1, c2, r2 = _RX_A1.match(a1).groups()
+        if c2 is None and r2 is None:
+            c2, r2 = c1, r1
+        r1 = int(r1) if r1 else 1
+        r2 = int(r2) if r2 else len(self.values)
+        c1 = _col_index(c1) if c1 else 1
+        c2 = _col_index(c2) if c2 else 10_000
+        out = []
+        for row in self.values[r1 - 1:r2]:
+            cells = [str(v) for v in row[c1 - 1:c2]]
+            while cells and cells[-1] == "":
+                cells.pop()
+            out.append(cells)
+        while out and not out[-1]:
+            out.pop()
+        return out
+
+    def get_all_values(self, **kwargs):
+        self._call("read")
+        return [[str(v) for v in row] for row in self.values]
+
+    def get_all_records(self, **kwargs):
+        values = self.get_all_values()
+        return [dict(zip(values[0], row)) for row in values[1:]]
+
+    def batch_get(self, ranges, **kwargs):
+        self._call("read")
+        return [self._range(r) for r in ranges]
+
+    def append_row(self, row, **kwargs):
+        self.append_rows([row], **kwargs)
+
+    def append_rows(self, rows, **kwargs):
+        self._call("write")
+        with self.sheet.lock:
+            self.values.extend(list(r) for r in rows)
+
+class FakeSpreadsheet:
+    """Se substitue à gspread.Spreadsheet; compte les appels par type."""
+
+    def __init__(self, products: int = 200, latency: float = 0.05, error_rate: float = 0.0,
+                 image_base: str = "", seed: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.calls = {"read": 0, "write": 0, "metadata": 0, "errors": 0}
+        self._rng = random.Random(seed)
+        self.tabs = {
+            "Products": FakeWorksheet(self, "Products", [HEADER] + make_products(products, image_base=image_base)),
+            "Orders": FakeWorksheet(self, "Orders", [["order_id", "timestamp", "user_id", "name", "phone",
+                                                     "address", "items_json", "total_cents", "status"]]),
+        }
+
+    def _call(self, kind: str):
+        with self.lock:
+            self.calls[kind] += 1
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.calls["errors"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise FakeSheetsError(f"fake {kind} error (429 quota)")
+
+    def worksheet(self, name: str):
+        self._call("metadata")
+        return self.tabs[name]
+
+    def values_batch_get(self, ranges, params=None):
+        self._call("read")
+        columns = (params or {}).get("majorDimension") == "COLUMNS"
+        out = []
+        for r in ranges:
+            title, a1 = r.split("!", 1) if "!" in r else ("Products", r)
+            values = self.tabs[title.strip("'").replace("''", "'")]._range(a1)
+            if columns:
+                width = max((len(row) for row in values), default=0)
+                values = [[row[c] if c < len(row) else "" for row in values] for c in range(width)]
+                for col in values:
+                    while col and col[-1] == "":
+                        col.pop()
+            out.append({"range": r, "values": values})
+        return {"valueRanges": out}
+
+    def touch_products(self, count: int):
+        """Simule une modification de `count` lignes (nouvelle valeur updated_at)."""
+        rows = self.tabs["Products"].values
+        stamp = time.strftime("%Y-%m-%dT%H:%M:%S") + f".{self._rng.randrange(10**6)}"
+        for row in self._rng.sample(rows[1:], min(count, len(rows) - 1)):
+            row[HEADER.index("updated_at")] = stamp
@@ -0,0 +1,98 @@
+# bench/fake_telegram.py — faux serveur Bot API (aiohttp) pour le banc de charge
+# Répond à /bot<token>/<méthode> avec des objets plausibles, compte les appels
+# par méthode et peut simuler latence, erreurs 400 et 429 (retry_after).
+import io, json, time, random, asyncio
+from collections import Counter
+
+from aiohttp import web
+
+def tiny_jpeg() -> bytes:
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new("RGB", (1600, 1200), (200, 120, 80)).save(out, "JPEG", quality=80)
+    return out.getvalue()
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.02, error_rate: float = 0.0, flood_rate: float = 0.0, seed: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.flood_rate = flood_rate
+        self.calls = Counter()
+        self.errors = Counter()
+        self._rng = random.Random(seed)
+        self._message_id = 1000
+        self._file_id = 0
+        self._image = None
+        self._runner = None
+        self.base_url = ""
+
+    # --- objets renvoyés ---
+
+    def _next_message(self, chat_id, **content) -> dict:
+        self._message_id += 1
+        return {"message_id": self._message_id, "date": int(time.time()),
+                "chat": {"id": int(chat_id or 0), "type": "private"}, **content}
+
+    def _photo(self) -> list[dict]:
+        self._file_id += 1
+        fid = f"fake-file-{self._file_id}"
+        return [{"file_id": fid, "file_unique_id": fid, "width": 1280, "height": 960}]
+
+    def _result(self, method: str, form: dict):
+        chat_id = form.get("chat_id") or 0
+        m = method.lower()
+        if m == "getme":
+            return {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if m in ("sendmessage", "editmessagetext"):
+            return self._next_message(chat_id, text=form.get("text", ""))
+        if m in ("sendphoto", "editmessagemedia", "editmessagecaption"):
+            return self._next_message(chat_id, photo=self._photo(), caption=form.get("caption"))
+        if m == "sendmediagroup":
+            media = json.loads(form.get("media", "[]"))
+            return [self._next_message(chat_id, photo=self._photo()) for _ in media]
+        if m == "editmessagereplymarkup":
+            return self._next_message(chat_id, text="")
+        return True  # answerCallbackQuery, answerInlineQuery, setWebhook...
+
+    # --- HTTP ---
+
+    async def _handle(self, request: web.Request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        form = dict(await request.post()) if request.can_read_body else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        roll = self._rng.random()
+        if roll < self.flood_rate:
+            self.errors["429"] += 1
+            return web.json_response({"ok": False, "error_code": 429,
+                                      "description": "Too Many Requests: retry after 1",
+                                      "parameters": {"retry_after": 1}}, status=429)
+        if roll < self.flood_rate + self.error_rate:
+            self.errors["400"] += 1
+            return web.json_response({"ok": False, "error_code": 400,
+                                      "description": "Bad Request: fake error"}, status=400)
+        form = {k: (v if isinstance(v, str) else "") for k, v in form.items()}
+        return web.json_response({"ok": True, "result": self._result(method, form)})
+
+    async def _img(self, request: web.Request):
+        self.calls["image_download"] += 1
+        if self._image is None:
+            self._image = tiny_jpeg()
+        return web.Response(body=self._image, content_type="image/jpeg")
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        app.router.add_get("/img/{name}", self._img)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
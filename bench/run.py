@@ -0,0 +1,363 @@
+# bench/run.py — banc de charge hors-ligne du bot
+#
+# Rejoue des flux d'updates synthétiques (navigation, coloris, ajout panier,
+# checkout complet) contre un faux serveur Bot API local et un faux Sheets en
+# mémoire (latence/erreurs simulées), soit directement via dp.feed_update, soit
+# via l'app ASGI de webhook_app. Affiche p50/p95/p99, débit et nombre d'appels
+# Sheets/Telegram par scénario; peut sauvegarder une baseline et s'y comparer.
+#
+#   python -m bench.run --users 50 --iterations 5
+#   python -m bench.run --target webhook --save-baseline bench/baseline.json
+#   python -m bench.run --compare bench/baseline.json --fail-on-regression
+import os, sys, json, time, asyncio, argparse, tempfile, statistics, urllib.parse
+
+SCENARIOS = ("browse", "color", "add_to_cart", "checkout", "search")
+REGRESSION_TOLERANCE = 0.10
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Banc de charge hors-ligne (faux Telegram + faux Sheets)")
+    ap.add_argument("--target", choices=("dp", "webhook", "both"), default="dp")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--users", type=int, default=20, help="utilisateurs simulés en parallèle")
+    ap.add_argument("--iterations", type=int, default=3, help="répétitions du scénario par utilisateur")
+    ap.add_argument("--products", type=int, default=200)
+    ap.add_argument("--sheets-latency", type=float, default=0.05, help="secondes par appel Sheets")
+    ap.add_argument("--sheets-errors", type=float, default=0.0, help="taux d'erreur Sheets (0-1)")
+    ap.add_argument("--tg-latency", type=float, default=0.02, help="secondes par appel Bot API")
+    ap.add_argument("--tg-errors", type=float, default=0.0, help="taux de 400 Bot API (0-1)")
+    ap.add_argument("--tg-flood", type=float, default=0.0, help="taux de 429 Bot API (0-1)")
+    ap.add_argument("--save-baseline", metavar="PATH")
+    ap.add_argument("--compare", metavar="PATH")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    ap.add_argument("--json", action="store_true", help="résultats bruts en JSON sur stdout")
+    return ap.parse_args(argv)
+
+def _prepare_env(workdir: str):
+    # doit précéder l'import de main/sheets: aucune ressource réelle n'est touchée
+    os.environ.update({
+        "BOT_TOKEN": "123456:BENCH-TOKEN",
+        "SHEET_ID": "bench",
+        "ADMINS": "900001,900002",
+        "PAYPAL_ME": "bench",
+        "STATE_BACKEND": "memory",
+        "CATALOG_SNAPSHOT": "",
+        "FILE_ID_CACHE": "",
+        "ORDERS_JOURNAL": os.path.join(workdir, "orders_journal.jsonl"),
+        "ORDER_INDEX_DB": os.path.join(workdir, "orders_index.db"),
+        "ORDERS_FLUSH_INTERVAL": "0.2",
+        "IMAGE_CACHE_DIR": os.path.join(workdir, "image_cache"),
+        "IMAGE_PREFETCH": "0",
+        # les utilisateurs simulés tapent plus vite qu'un humain: limiteur entrant coupé par défaut
+        "THROTTLE": os.getenv("THROTTLE", "off"),
+        # le faux Telegram n'impose pas de quota: régulateur actif mais sans plafond réaliste
+        "OUTBOUND_GLOBAL_RATE": os.getenv("OUTBOUND_GLOBAL_RATE", "10000"),
+        "OUTBOUND_GLOBAL_BURST": os.getenv("OUTBOUND_GLOBAL_BURST", "10000"),
+        "OUTBOUND_CHAT_RATE": os.getenv("OUTBOUND_CHAT_RATE", "1000"),
+        "OUTBOUND_CHAT_BURST": os.getenv("OUTBOUND_CHAT_BURST", "1000"),
+    })
+
+# --- fabrication d'updates ---------------------------------------------------------
+
+class Updates:
+    def __init__(self):
+        self._update_id = 0
+        self._message_id = 0
+
+    def _ids(self):
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+
+    @staticmethod
+    def _user(uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": f"User{uid}", "username": f"user{uid}"}
+
+    def text(self, uid: int, text: str) -> dict:
+        upd, mid = self._ids()
+        msg = {"message_id": mid, "date": int(time.time()), "chat": {"id": uid, "type": "private"},
+               "from": self._user(uid), "text": text}
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": upd, "message": msg}
+
+    def callback(self, uid: int, data: str) -> dict:
+        upd, mid = self._ids()
+        photo = [{"file_id": "bench-photo", "file_unique_id": "bench-photo", "width": 1280, "height": 960}]
+        return {"update_id": upd, "callback_query": {
+            "id": str(upd), "from": self._user(uid), "chat_instance": str(uid), "data": data,
+            "message": {"message_id": mid, "date": int(time.time()), "chat": {"id": uid, "type": "private"},
+                        "photo": photo, "caption": "…"},
+        }}
+
+    def inline(self, uid: int, query: str) -> dict:
+        upd, _ = self._ids()
+        return {"update_id": upd, "inline_query": {"id": str(upd), "from": self._user(uid), "query": query, "offset": ""}}
+
+def scenario_steps(name: str, u: Updates, uid: int, catalog) -> list[dict]:
+    p = catalog.products[uid % len(catalog.products)]
+    color = p["colors"][0] if p["colors"] else None
+    enc = urllib.parse.quote(color, safe="") if color else ""
+    pick = ([u.callback(uid, f"add:{p['id']}")]
+            + ([u.callback(uid, f"color:{p['id']}:{enc}"), u.callback(uid, f"confirm_color:{p['id']}:{enc}")]
+               if color else [])
+            + [u.text(uid, "42")])
+    if name == "browse":
+        cat = catalog.categories[uid % len(catalog.categories)]
+        return [u.text(uid, "/catalogue")] + [u.callback(uid, f"cat:{cat}:{k}") for k in range(8)]
+    if name == "color":
+        return [u.callback(uid, f"add:{p['id']}")] + [
+            u.callback(uid, f"color:{p['id']}:{urllib.parse.quote(c, safe='')}") for c in p["colors"][:3]
+        ]
+    if name == "add_to_cart":
+        return pick + [u.callback(uid, "cart:view")]
+    if name == "checkout":
+        return pick + [
+            u.callback(uid, "checkout:start"),
+            u.text(uid, f"Client {uid}"),
+            u.text(uid, "06 12 34 56 78"),
+            u.text(uid, f"{u._update_id} rue du Banc, 75000 Paris"),  # adresse unique: pas de dédoublonnage
+        ]
+    if name == "search":
+        word = p["name"].split()[0]
+        return [u.text(uid, f"/search {word}"), u.callback(uid, f"show:{p['id']}"),
+                u.inline(uid, word[:4]), u.text(uid, f"/start p_{p['id']}")]
+    raise ValueError(f"scénario inconnu: {name}")
+
+# --- pilotes -------------------------------------------------------------------
+
+class DpDriver:
+    name = "dp"
+
+    def __init__(self, main_mod):
+        from aiogram.types import Update
+        self._Update = Update
+        self.main = main_mod
+
+    async def start(self):
+        await self.main.dp.emit_startup(bot=self.main.bot)
+
+    async def stop(self):
+        await self.main.dp.emit_shutdown(bot=self.main.bot)
+
+    async def send(self, payload: dict) -> float:
+        update = self._Update.model_validate(payload)
+        t0 = time.perf_counter()
+        await self.main.dp.feed_update(self.main.bot, update)
+        return time.perf_counter() - t0
+
+class WebhookDriver:
+    """Pilote l'app ASGI directement (sans serveur HTTP); latence = POST -> fin du handler."""
+    name = "webhook"
+
+    def __init__(self, webhook_mod):
+        self.mod = webhook_mod
+        self.app = webhook_mod.app
+        self.path = f"/webhook/{webhook_mod.WEBHOOK_SECRET}"
+        self._done: dict[int, asyncio.Future] = {}
+        self.ack_latencies: list[float] = []
+        self._lifespan = None
+        self._ls_in = asyncio.Queue()
+        self._ls_out = asyncio.Queue()
+        feed = webhook_mod.updates._handle
+
+        async def timed_feed(update):
+            try:
+                await feed(update)
+            finally:
+                fut = self._done.pop(update.update_id, None)
+                if fut is not None and not fut.done():
+                    fut.set_result(time.perf_counter())
+        webhook_mod.updates._handle = timed_feed
+
+    async def start(self):
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}}
+        self._lifespan = asyncio.create_task(self.app(scope, self._ls_in.get, self._ls_out.put))
+        await self._ls_in.put({"type": "lifespan.startup"})
+        msg = await self._ls_out.get()
+        if msg["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"échec du démarrage ASGI: {msg}")
+
+    async def stop(self):
+        await self._ls_in.put({"type": "lifespan.shutdown"})
+        await self._ls_out.get()
+        await self._lifespan
+
+    async def _post(self, body: bytes) -> int:
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": self.path, "raw_path": self.path.encode(), "query_string": b"",
+            "root_path": "", "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 80),
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        }
+        sent = asyncio.Event()
+        body_sent = False
+        status = {}
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await sent.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                sent.set()
+
+        await self.app(scope, receive, send)
+        return status.get("code", 0)
+
+    async def send(self, payload: dict) -> float:
+        fut = asyncio.get_running_loop().create_future()
+        self._done[payload["update_id"]] = fut
+        t0 = time.perf_counter()
+        code = await self._post(json.dumps(payload).encode())
+        self.ack_latencies.append(time.perf_counter() - t0)
+        if code != 200:
+            self._done.pop(payload["update_id"], None)
+            raise RuntimeError(f"webhook HTTP {code}")
+        return await fut - t0
+
+# --- mesures -------------------------------------------------------------------
+
+def _pct(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+
+def summarize(latencies: list[float], wall: float, errors: int, sheets_calls: dict, tg_calls: dict,
+              ack: list[float] | None = None) -> dict:
+    out = {
+        "updates": len(latencies),
+        "errors": errors,
+        "throughput_ups": round(len(latencies) / wall, 1) if wall else 0.0,
+        "p50_ms": round(_pct(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(_pct(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(_pct(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "sheets_calls": sheets_calls,
+        "telegram_calls": tg_calls,
+    }
+    if ack:
+        out["ack_p95_ms"] = round(_pct(ack, 0.95) * 1000, 2)
+    return out
+
+def _diff(after: dict, before: dict) -> dict:
+    return {k: after[k] - before.get(k, 0) for k in after if after[k] - before.get(k, 0)}
+
+async def run_scenario(driver, name: str, args, fake_sheets, fake_tg, catalog, updates: Updates) -> dict:
+    sheets_before, tg_before = dict(fake_sheets.calls), dict(fake_tg.calls)
+    latencies: list[float] = []
+    errors = 0
+    ack_start = len(getattr(driver, "ack_latencies", []))
+
+    async def user(i: int):
+        nonlocal errors
+        uid = 10_000 + i
+        for _ in range(args.iterations):
+            for payload in scenario_steps(name, updates, uid, catalog):
+                try:
+                    latencies.append(await driver.send(payload))
+                except Exception as e:
+                    errors += 1
+                    if errors <= 3:
+                        print(f"[BENCH] {name}/{driver.name}: {e!r}", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(args.users)))
+    wall = time.perf_counter() - t0
+    ack = getattr(driver, "ack_latencies", [])[ack_start:] or None
+    return summarize(latencies, wall, errors, _diff(fake_sheets.calls, sheets_before),
+                     _diff(dict(fake_tg.calls), tg_before), ack)
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    regressions = []
+    for key, cur in results.items():
+        ref = baseline.get(key)
+        if not ref:
+            continue
+        line = (f"{key:<24} p95 {ref['p95_ms']:>8.2f} -> {cur['p95_ms']:>8.2f} ms   "
+                f"débit {ref['throughput_ups']:>7.1f} -> {cur['throughput_ups']:>7.1f} upd/s")
+        if (cur["p95_ms"] > ref["p95_ms"] * (1 + REGRESSION_TOLERANCE)
+                or cur["throughput_ups"] < ref["throughput_ups"] * (1 - REGRESSION_TOLERANCE)):
+            line += "   <-- RÉGRESSION"
+            regressions.append(key)
+        print(line)
+    return regressions
+
+def print_table(results: dict):
+    print(f"{'scénario/cible':<24}{'upd':>6}{'err':>5}{'upd/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}  appels")
+    for key, r in results.items():
+        calls = f"sheets={r['sheets_calls']} tg={sum(r['telegram_calls'].values())}"
+        print(f"{key:<24}{r['updates']:>6}{r['errors']:>5}{r['throughput_ups']:>9.1f}"
+              f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}  {calls}")
+
+async def amain(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    _prepare_env(workdir)
+
+    from bench.fake_telegram import FakeTelegram
+    from bench.fake_sheets import FakeSpreadsheet
+
+    fake_tg = FakeTelegram(latency=args.tg_latency, error_rate=args.tg_errors, flood_rate=args.tg_flood)
+    base_url = await fake_tg.start()
+    fake_sheets = FakeSpreadsheet(products=args.products, latency=args.sheets_latency,
+                                  error_rate=args.sheets_errors, image_base=base_url)
+
+    import sheets
+    sheets._gc, sheets._sh = object(), fake_sheets  # _ensure_client ne s'authentifie plus
+    import main
+    from aiogram.client.telegram import TelegramAPIServer
+    main.bot.session.api = TelegramAPIServer.from_base(base_url)  # garde les middlewares de session
+
+    catalog = await sheets.get_catalog_async(force=True)
+    updates = Updates()
+    drivers = []
+    if args.target in ("dp", "both"):
+        drivers.append(DpDriver(main))
+    if args.target in ("webhook", "both"):
+        import webhook_app
+        drivers.append(WebhookDriver(webhook_app))
+
+    results = {}
+    try:
+        for driver in drivers:
+            await driver.start()
+            try:
+                for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+                    results[f"{name}/{driver.name}"] = await run_scenario(
+                        driver, name, args, fake_sheets, fake_tg, catalog, updates)
+            finally:
+                await driver.stop()
+    finally:
+        await fake_tg.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print_table(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"saved_at": time.strftime("%Y-%m-%d %H:%M:%S"), "args": vars(args),
+                       "results": results}, f, indent=2, ensure_ascii=False)
+        print(f"baseline sauvegardée: {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        print("\ncomparaison avec la baseline:")
+        regressions = compare(results, baseline)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+def main(argv=None) -> int:
+    return asyncio.run(amain(parse_args(argv)))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# catalog.py — index en mémoire du catalogue, reconstruit à chaque rechargement
+import itertools
+
+_versions = itertools.count(1)
+
+def norm_color(color: str | None) -> str:
+    return (color or "").strip().lower()
+
+class Product:
+    """Produit actif, compact (__slots__) mais lu comme un dict: p["name"], p.get("colors")."""
+    __slots__ = ("id", "name", "price_cents", "sizes", "category", "image", "stock", "colors", "image_color_map")
+
+    def __init__(self, id: int, name: str = "", price_cents: int = 0, sizes: str = "", category: str = "",
+                 image: str = "", stock: int = 0, colors: tuple = (), image_color_map: dict | None = None):
+        self.id = id
+        self.name = name
+        self.price_cents = price_cents
+        self.sizes = sizes
+        self.category = category
+        self.image = image
+        self.stock = stock
+        self.colors = colors
+        self.image_color_map = image_color_map or {}  # partagé entre produits identiques: lecture seule
+
+    def __getitem__(self, key):
+        if key not in _PRODUCT_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in _PRODUCT_FIELDS else default
+
+    def __contains__(self, key):
+        return key in _PRODUCT_FIELDS
+
+    def keys(self):
+        return self.__slots__
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Product":
+        d = {k: v for k, v in d.items() if k in _PRODUCT_FIELDS}
+        d["colors"] = tuple(d.get("colors") or ())
+        return cls(**d)
+
+    def __eq__(self, other):
+        if not isinstance(other, Product):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    __hash__ = None  # mutable en théorie, comparé par valeur (rechargement sans changement)
+
+    def __repr__(self):
+        return f"Product(id={self.id!r}, name={self.name!r})"
+
+_PRODUCT_FIELDS = frozenset(Product.__slots__)
+
+class Catalog:
+    """Instantané immuable et versionné des produits actifs.
+
+    Toutes les lectures des handlers (fiche, pagination, catégories, image d'un
+    coloris) deviennent de simples accès dict/slice.
+    """
+    __slots__ = ("version", "products", "by_id", "by_category", "categories", "color_images")
+
+    def __init__(self, products: list[Product]):
+        self.version = next(_versions)
+        self.products = products
+        self.by_id = {}
+        self.by_category = {}
+        self.color_images = {}
+        for p in products:
+            self.by_id.setdefault(p["id"], p)
+            if p["category"]:
+                self.by_category.setdefault(p["category"], []).append(p)
+            imgs = {}
+            for k, v in (p.get("image_color_map") or {}).items():
+                if v:
+                    imgs.setdefault(norm_color(k), v)
+            self.color_images[p["id"]] = imgs
+        self.categories = sorted(self.by_category)
+
+    def __len__(self):
+        return len(self.products)
+
+    def image_urls(self) -> list[str]:
+        """URLs d'images sans doublon, dans l'ordre du catalogue (image principale puis coloris)."""
+        urls = {}
+        for p in self.products:
+            if p["image"]:
+                urls[p["image"]] = None
+            urls.update(dict.fromkeys(self.color_images.get(p["id"], {}).values()))
+        return list(urls)
+
+    def get(self, pid: int):
+        return self.by_id.get(pid)
+
+    def page(self, category=None, offset=0, limit=6):
+        prods = self.by_category.get(category, ()) if category else self.products
+        return prods[offset: offset+limit], len(prods)
+
+    def image_for(self, product: dict, color: str | None = None) -> str:
+        if color:
+            img_map = product.get("image_color_map") or {}
+            if img_map.get(color):
+                return img_map[color]
+            imgs = self.color_images.get(product["id"])
+            if imgs is None or self.by_id.get(product["id"]) is not product:
+                # produit d'un ancien instantané: on normalise à la volée
+                imgs = {norm_color(k): v for k, v in reversed(list(img_map.items())) if v}
+            img = imgs.get(norm_color(color))
+            if img:
+                return img
+        return product.get("image") or ""
+
+EMPTY = Catalog([])
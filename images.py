@@ -0,0 +1,190 @@
+# images.py — pré-traitement des images produit (Pillow) + cache disque LRU
+# Chaque image du catalogue (image principale + images des coloris) est
+# téléchargée une seule fois, redimensionnée/recompressée pour Telegram dans un
+# pool de threads, puis stockée sur disque. Les envois se font ensuite depuis
+# ces octets locaux: plus de dépendance à la latence de Drive.
+import os, io, time, hashlib, asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from aiogram.types import BufferedInputFile
+
+from sheets import on_catalog_change
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_MB = float(os.getenv("IMAGE_CACHE_MAX_MB", "200"))
+IMAGE_PREFETCH = os.getenv("IMAGE_PREFETCH", "1").strip().lower() in ("1", "true", "yes", "oui")
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_RETRY_AFTER = float(os.getenv("IMAGE_RETRY_AFTER", "900"))  # s avant de retenter une URL en échec
+PREFETCH_BUDGET = 0.8    # part du cache disque que le préchargement peut remplir
+
+MAX_SIDE = 1280          # Telegram redimensionne de toute façon au-delà
+JPEG_QUALITY = 85
+MAX_BYTES = 10 * 1024 * 1024  # limite send_photo
+DOWNLOAD_TIMEOUT = 20
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="images")
+# le préchargement a son propre thread: les clics clients ne passent jamais derrière lui
+_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="images-prefetch")
+_prefetch_gen = 0  # un nouveau catalogue abandonne le préchargement du précédent
+_url_locks: dict[str, threading.Lock] = {}
+_url_locks_guard = threading.Lock()
+_failed: dict[str, float] = {}  # url -> monotonic avant lequel on ne retente pas (lien cassé, page HTML...)
+
+def _path_for(url: str) -> str:
+    return os.path.join(IMAGE_CACHE_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".jpg")
+
+def _download(url: str) -> bytes:
+    import urllib.request
+    req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
+    with urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT) as resp:
+        return resp.read(MAX_BYTES * 4)
+
+def _process(data: bytes) -> bytes:
+    from PIL import Image, ImageOps  # différé: seulement quand une image est préparée
+    with Image.open(io.BytesIO(data)) as im:
+        im = ImageOps.exif_transpose(im)
+        if im.mode in ("RGBA", "LA", "PA") or (im.mode == "P" and "transparency" in im.info):
+            # JPEG n'a pas de transparence: fond blanc (sinon les zones transparentes deviennent noires)
+            im = im.convert("RGBA")
+            im = Image.alpha_composite(Image.new("RGBA", im.size, (255, 255, 255, 255)), im)
+        if im.mode != "RGB":
+            im = im.convert("RGB")
+        im.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+        quality = JPEG_QUALITY
+        while True:
+            out = io.BytesIO()
+            im.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+            if out.tell() <= MAX_BYTES or quality <= 40:
+                return out.getvalue()
+            quality -= 15
+
+def _evict():
+    """Supprime les fichiers les moins récemment utilisés au-delà de IMAGE_CACHE_MAX_MB."""
+    try:
+        entries = [e for e in os.scandir(IMAGE_CACHE_DIR) if e.is_file() and e.name.endswith(".jpg")]
+    except FileNotFoundError:
+        return
+    stats = []
+    for e in entries:
+        try:
+            st = e.stat()
+        except FileNotFoundError:
+            continue  # supprimé entre-temps par un autre worker
+        stats.append((st.st_mtime, st.st_size, e.path))
+    total = sum(s for _, s, _ in stats)
+    limit = IMAGE_CACHE_MAX_MB * 1024 * 1024
+    for _, size, path in sorted(stats):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def _read_cached(path: str) -> bytes | None:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)  # mtime = dernier accès (LRU)
+    except OSError:
+        pass
+    return data
+
+def _load_or_build(url: str) -> bytes | None:
+    path = _path_for(url)
+    data = _read_cached(path)
+    if data is not None:
+        return data
+    if _failed.get(url, 0) > time.monotonic():
+        return None
+    with _url_locks_guard:
+        lock = _url_locks.setdefault(url, threading.Lock())
+    try:
+        with lock:  # une seule préparation par URL, les autres attendent son résultat
+            data = _read_cached(path)
+            if data is not None:
+                return data
+            if _failed.get(url, 0) > time.monotonic():
+                return None  # échec constaté pendant qu'on attendait
+            try:
+                data = _process(_download(url))
+            except Exception as e:
+                print(f"[IMAGE ERROR] {url}: {e}")
+                _failed[url] = time.monotonic() + IMAGE_RETRY_AFTER
+                return None
+            _failed.pop(url, None)
+            os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+    finally:
+        with _url_locks_guard:
+            _url_locks.pop(url, None)
+    _evict()
+    return data
+
+async def prime(urls, timeout: float | None = None) -> int:
+    """Prépare les images données et attend le résultat (warm-up); renvoie le nombre prêtes."""
+    loop = asyncio.get_running_loop()
+    futs = [loop.run_in_executor(_executor, partial(_load_or_build, u))
+            for u in urls if u and u.startswith(("http://", "https://"))]
+    if not futs:
+        return 0
+    done, _ = await asyncio.wait(futs, timeout=timeout)
+    return sum(1 for f in done if not f.exception() and f.result() is not None)
+
+async def local_photo(url: str) -> BufferedInputFile | None:
+    """Image prête pour Telegram (octets locaux) si elle est déjà en cache, sinon None.
+
+    Jamais de téléchargement sur le chemin d'un clic: une image absente est
+    préparée en arrière-plan et l'appelant envoie l'URL en attendant.
+    """
+    if not url or not url.startswith(("http://", "https://")):
+        return None
+    path = _path_for(url)
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(_executor, _read_cached, path)
+    if data is None:
+        if _failed.get(url, 0) <= time.monotonic():
+            _executor.submit(_load_or_build, url)
+        return None
+    return BufferedInputFile(data, filename=os.path.basename(path))
+
+def _prefetch_run(urls: list[str], gen: int):
+    """Prépare les images manquantes dans l'ordre du catalogue, sans dépasser le budget disque."""
+    budget = IMAGE_CACHE_MAX_MB * 1024 * 1024 * PREFETCH_BUDGET
+    sizes = []
+    for url in urls:
+        try:
+            sizes.append(os.stat(_path_for(url)).st_size)
+        except OSError:
+            sizes.append(None)
+    known = [n for n in sizes if n is not None]
+    avg = sum(known) / len(known) if known else 200 * 1024
+    total = 0.0
+    for url, size in zip(urls, sizes):
+        total += avg if size is None else size
+        if total > budget:
+            break  # le reste évincerait ce qu'on vient de préparer: préparé à la demande
+        if gen != _prefetch_gen:
+            return
+        if size is None and _failed.get(url, 0) <= time.monotonic():
+            _load_or_build(url)
+
+@on_catalog_change
+def _prefetch(catalog):
+    global _prefetch_gen
+    if not IMAGE_PREFETCH:
+        return
+    now = time.monotonic()
+    for url in [u for u, until in _failed.items() if until <= now]:
+        _failed.pop(url, None)
+    _prefetch_gen += 1
+    urls = [u for u in catalog.image_urls() if u.startswith(("http://", "https://"))]
+    _prefetch_executor.submit(_prefetch_run, urls, _prefetch_gen)
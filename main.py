@@ -1,17 +1,33 @@
 # main.py — Telegram bot (PayPal.me) + MP direct pour "photo de modèle"
-import os, asyncio, time, urllib.parse
+import os, re, json, asyncio, time, hashlib, functools, urllib.parse
 from pathlib import Path
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import CommandStart, Command
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.types import (
     Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton,
-    ReplyKeyboardMarkup, KeyboardButton, InputMediaPhoto
+    ReplyKeyboardMarkup, KeyboardButton, InputMediaPhoto,
+    InlineQuery, InlineQueryResultPhoto, InlineQueryResultArticle, InputTextMessageContent
 )
 from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
 from dotenv import load_dotenv
 
-from sheets import list_categories, list_products, get_product, get_image_for, append_order
-from models import carts, add_to_cart, remove_from_cart, empty_cart, cart_total_cents
+from sheets import (
+    get_catalog_async, get_product_async, get_image_for
+)
+import orders
+from order_index import index as order_index, backfill as backfill_order_index
+import media
+from media import photo_input, remember, forget, is_media_error
+from models import get_cart, add_to_cart, remove_from_cart, empty_cart, cart_total_cents
+from storage import StoreFSMStorage, store as state_store
+import sessions
+from sessions import SessionMap
+from render import RenderCache
+from search import index as search_index
+from throttle import ThrottleMiddleware
+import metrics
+import outbound
+import views
 
 # ----------- .env -----------
 load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
@@ -42,21 +58,85 @@ if not PAYPAL_ME:
     print("[WARN] PAYPAL_ME est vide. Configure-le dans .env pour activer le paiement.")
 
 bot = Bot(BOT_TOKEN)
-dp = Dispatcher()
+bot.session.middleware(outbound.OutboundGovernor())  # d'abord: les métriques ne mesurent que l'appel réseau
+bot.session.middleware(metrics.TelegramMetricsMiddleware())
+dp = Dispatcher(storage=StoreFSMStorage())
 
 PAGE_SIZE = 4
+ORDER_DEDUP_WINDOW = float(os.getenv("ORDER_DEDUP_WINDOW", "120"))  # même panier+adresse: même commande (s)
+SEARCH_RESULTS = int(os.getenv("SEARCH_RESULTS", "8"))             # boutons renvoyés par /search
+SEARCH_INLINE_CACHE = int(os.getenv("SEARCH_INLINE_CACHE", "300"))  # cache_time des réponses inline (s)
 
 # ----- États -----
-user_checkout = {}          # uid -> {"_active": True, "_stage": "...", "name","phone","address"}
-checkout_prompt = {}        # uid -> "name" | "phone" | "address"
-manual_size_wait = {}       # uid -> {"pid":..., "color":...}
-custom_model_wait = {}      # uid -> {"file_id": "...", "caption": "..."}
+# Adossés au store (storage.py): une valeur modifiée doit être réaffectée.
+# Expirés par sessions.py (TTL depuis la dernière écriture, surchargeable via SESSION_TTL_<NOM>).
+user_checkout = SessionMap("checkout", ttl=2 * 3600)            # uid -> {"_active": True, "_stage": "...", "name","phone","address"}
+checkout_prompt = SessionMap("checkout_prompt", ttl=2 * 3600)   # uid -> "name" | "phone" | "address"
+manual_size_wait = SessionMap("size_wait", ttl=30 * 60)         # uid -> {"pid":..., "color":...}
+custom_model_wait = SessionMap("model_wait", ttl=30 * 60)       # uid -> {"file_id": "...", "caption": "..."}
+last_order = SessionMap("last_order", ttl=5 * 60)              # uid -> {"fp", "order_id", "total", "at"} (anti double envoi)
+
+# libellés métriques bornés: une commande ou un callback inconnu (texte libre d'un
+# utilisateur) tombe dans "/other" ou "other:" au lieu de créer une nouvelle série
+CALLBACK_PREFIXES = frozenset({"browse", "help", "cat", "show", "add", "color", "colors", "confirm_color",
+                               "custom", "cart", "checkout", "paypal", "ords"})
+
+@functools.cache
+def known_commands() -> frozenset[str]:
+    """"/start", "/search"... déclarées par les handlers (filtres Command), lues au premier update."""
+    found = set()
+    for h in dp.message.handlers:
+        for f in h.filters or ():
+            found.update("/" + c for c in getattr(f.callback, "commands", ()) if isinstance(c, str))
+    return frozenset(found)
+
+def handler_label(update) -> str:
+    """Libellé métrique d'un update: préfixe du callback (`cat:`...), commande ou type de contenu."""
+    if update.callback_query:
+        data = update.callback_query.data or ""
+        prefix = data.split(":", 1)[0]
+        if prefix not in CALLBACK_PREFIXES:
+            return "other:"
+        return prefix + ":" if ":" in data else data
+    if update.message:
+        text = update.message.text or ""
+        if text.startswith("/"):
+            cmd = text.split()[0].split("@")[0]
+            return cmd if cmd in known_commands() else "/other"
+        return update.message.content_type
+    return update.event_type
+
+@dp.update.outer_middleware()
+async def measure_handler(handler, event, data):
+    label = handler_label(event)
+    t0 = time.perf_counter()
+    try:
+        return await handler(event, data)
+    except Exception:
+        metrics.HANDLER_ERRORS.inc(label)
+        raise
+    finally:
+        metrics.HANDLER_LATENCY.observe(time.perf_counter() - t0, label)
+
+dp.update.outer_middleware(ThrottleMiddleware())
+
+@dp.update.outer_middleware()
+async def flush_state(handler, event, data):
+    user = data.get("event_from_user")
+    if user:
+        sessions.touch_user(user.id)
+    # les écritures d'état d'un update partent en une seule transaction
+    try:
+        return await handler(event, data)
+    finally:
+        state_store.flush()
 
 # ---------------------------- Utils ----------------------------
 
 def money(cents: int) -> str:
     return f"{cents/100:.2f} €"
 
+@functools.cache
 def support_url() -> str | None:
     if SUPPORT_URL_ENV:
         return SUPPORT_URL_ENV
@@ -67,14 +147,17 @@ def support_url() -> str | None:
             return f"tg://user?id={aid}"
     return None
 
+@functools.cache
 def kb_support_row():
     url = support_url()
     if url:
         return [InlineKeyboardButton(text="🆘 Besoin d’aide", url=url)]
     return [InlineKeyboardButton(text="🆘 Besoin d’aide", callback_data="help")]
 
-def cat_kb():
-    cats = list_categories()
+# claviers/légendes dérivés du catalogue: reconstruits seulement quand sa version change
+_render = RenderCache()
+
+def _build_cat_kb(cats):
     rows = [[InlineKeyboardButton(text=c, callback_data=f"cat:{c}:0")] for c in cats]
     rows.append([InlineKeyboardButton(text="Tout voir", callback_data="cat::0")])
     rows.append([InlineKeyboardButton(text="📦 Panier", callback_data="cart:view")])
@@ -82,18 +165,23 @@ def cat_kb():
     rows.append(kb_support_row())
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
-async def safe_edit(cb_or_msg, text, reply_markup=None, parse_mode="Markdown"):
+async def cat_kb():
+    catalog = await get_catalog_async()
+    return _render.get(catalog.version, "cat_kb", lambda: _build_cat_kb(catalog.categories))
+
+async def safe_edit(cb_or_msg, text, reply_markup=None, parse_mode="Markdown", image=None):
+    """Met à jour le message du callback (un seul appel, aucun si inchangé); sinon nouveau message."""
     if isinstance(cb_or_msg, Message):
         await cb_or_msg.answer(text, parse_mode=parse_mode, reply_markup=reply_markup)
         return
     m = cb_or_msg.message
-    try:
-        if m.content_type in ("photo", "video", "animation", "document"):
-            await m.edit_caption(caption=text, parse_mode=parse_mode, reply_markup=reply_markup)
-        else:
-            await m.edit_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
-    except TelegramBadRequest:
-        await m.answer(text, parse_mode=parse_mode, reply_markup=reply_markup)
+    for img in ((image, None) if image else (None,)):
+        try:
+            await views.show(m, text, img, reply_markup, parse_mode)
+            return
+        except TelegramBadRequest:
+            pass  # image refusée: on tente le texte seul, puis un nouveau message
+    await m.answer(text, parse_mode=parse_mode, reply_markup=reply_markup)
 
 def post_add_kb():
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -154,18 +242,19 @@ def prefilled_share_link_for_user(u) -> str:
 
 # --------- checkout helpers ---------
 
-def _get_or_init_checkout(uid: int):
-    return user_checkout.setdefault(uid, {"_active": True})
+def checkout_update(uid: int, **fields):
+    def merge(u):
+        u = dict(u or {"_active": True})
+        u.update(fields)
+        return u
+    return user_checkout.mutate(uid, merge)
 
 def stage_get(uid: int):
     u = user_checkout.get(uid)
     return u.get("_stage") if (u and u.get("_active")) else None
 
 def stage_set(uid: int, stage: str):
-    u = _get_or_init_checkout(uid)
-    u["_active"] = True
-    u["_stage"] = stage
-    user_checkout[uid] = u
+    checkout_update(uid, _active=True, _stage=stage)
     checkout_prompt[uid] = stage
 
 async def prompt_name(m: Message):
@@ -203,31 +292,71 @@ async def prompt_address(m: Message):
 
 # --------- admin notifications ---------
 
+# Envois en parallèle entre admins (borné), séquentiels pour un même admin.
+ADMIN_NOTIFY_CONCURRENCY = int(os.getenv("ADMIN_NOTIFY_CONCURRENCY", "4"))
+MEDIA_GROUP_MAX = 10  # limite Telegram d'un album
+_admin_sem = asyncio.Semaphore(ADMIN_NOTIFY_CONCURRENCY)
+_background_tasks = set()
+
+def spawn(coro):
+    """Lance une tâche de fond en gardant une référence (sinon le GC peut l'annuler)."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def _fan_out(send_one) -> int:
+    async def run(admin):
+        async with _admin_sem:
+            return await send_one(admin)
+    with outbound.background():  # les réponses aux clients passent avant
+        return sum(await asyncio.gather(*(run(a) for a in ADMINS)))
+
 async def notify_admins_text(text: str, parse_mode: str = "Markdown") -> int:
-    ok = 0
-    for admin in ADMINS:
+    async def send_one(admin):
         try:
             await bot.send_message(admin, text, parse_mode=parse_mode)
-            ok += 1
+            return 1
         except Exception as e:
             print(f"[ADMIN NOTIFY ERROR text -> {admin}] {e}")
-    return ok
+            return 0
+    return await _fan_out(send_one)
 
-async def notify_admins_photo_url(url_or_file_id: str, caption: str, parse_mode: str = "Markdown") -> int:
+async def _send_photos(admin, photos, parse_mode: str = "Markdown") -> int:
+    """Envoie [(url, légende)] à un admin, par albums de 10 (1 photo seule: send_photo)."""
     ok = 0
-    for admin in ADMINS:
+    for i in range(0, len(photos), MEDIA_GROUP_MAX):
+        chunk = photos[i:i + MEDIA_GROUP_MAX]
+        refs = [await photo_input(url) for url, _ in chunk]
         try:
-            await bot.send_photo(admin, photo=url_or_file_id, caption=caption, parse_mode=parse_mode)
+            if len(chunk) == 1:
+                msgs = [await bot.send_photo(admin, photo=refs[0], caption=chunk[0][1], parse_mode=parse_mode)]
+            else:
+                msgs = await bot.send_media_group(admin, media=[
+                    InputMediaPhoto(media=ref, caption=cap, parse_mode=parse_mode)
+                    for ref, (_, cap) in zip(refs, chunk)
+                ])
+            for (url, _), msg in zip(chunk, msgs):
+                remember(url, msg)
             ok += 1
         except Exception as e:
             print(f"[ADMIN NOTIFY ERROR photo -> {admin}] {e}")
+            if is_media_error(e):  # pas quand l'admin a bloqué le bot, légende invalide, etc.
+                for ref, (url, _) in zip(refs, chunk):
+                    if isinstance(ref, str) and ref != url:
+                        forget(url)
             try:
-                await bot.send_message(admin, caption + f"\n(photo: {url_or_file_id})", parse_mode=parse_mode)
+                await bot.send_message(
+                    admin, "\n\n".join(f"{cap}\n(photo: {url})" for url, cap in chunk), parse_mode=parse_mode
+                )
                 ok += 1
             except Exception as e2:
                 print(f"[ADMIN NOTIFY ERROR fallback -> {admin}] {e2}")
     return ok
 
+async def notify_admins_photo_url(url_or_file_id: str, caption: str, parse_mode: str = "Markdown") -> int:
+    return await _fan_out(lambda admin: _send_photos(admin, [(url_or_file_id, caption)], parse_mode))
+
 async def notify_admins_order_with_photos(order: dict, items) -> int:
     header = (
         f"🆕 Nouvelle commande #{order['order_id']}\n"
@@ -235,20 +364,49 @@ async def notify_admins_order_with_photos(order: dict, items) -> int:
         f"Adresse: {order['address']}\n"
         f"Total: {money(order['total_cents'])}"
     )
-    sent = await notify_admins_text(header)
+    # images résolues une seule fois, pas une fois par admin
+    catalog = await get_catalog_async()
+    photos, texts = [], []
     for it in items:
-        p = get_product(it["id"])
-        img = get_image_for(p, it.get("color"))
+        p = catalog.get(it["id"])
+        img = get_image_for(p, it.get("color")) if p else ""
         cap = (
             f"{it['name']}"
             f"{(' • ' + it['color']) if it.get('color') else ''} • T.{it['size']}\n"
             f"Qté: {it['qty']} — {money(it['price_cents']*it['qty'])}"
         )
         if img:
-            sent += await notify_admins_photo_url(img, cap)
+            photos.append((img, cap))
         else:
-            sent += await notify_admins_text(cap)
-    return sent
+            texts.append(cap)
+
+    async def send_one(admin):
+        sent = 0
+        for text in [header] + texts:
+            try:
+                await bot.send_message(admin, text, parse_mode="Markdown")
+                sent += 1
+            except Exception as e:
+                print(f"[ADMIN NOTIFY ERROR text -> {admin}] {e}")
+        return sent + await _send_photos(admin, photos)
+    return await _fan_out(send_one)
+
+async def notify_order_in_background(order: dict, items, chat_id: int):
+    """Notification admin hors du handler client; prévient le client si personne n'a été joint."""
+    try:
+        sent = await notify_admins_order_with_photos(order, items)
+    except Exception as e:
+        print(f"[ADMIN NOTIFY ERROR order #{order['order_id']}] {e}")
+        sent = 0
+    if sent == 0:
+        try:
+            await bot.send_message(
+                chat_id,
+                "ℹ️ Note : je n’ai pas pu notifier l’admin en MP. Il devra *démarrer le bot* et vérifier `ADMINS`.",
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=[kb_support_row()])
+            )
+        except Exception as e:
+            print(f"[NOTE CLIENT ERROR -> {chat_id}] {e}")
 
 # ---------------------------- Commands ----------------------------
 
@@ -270,8 +428,135 @@ async def help_cmd(m: Message):
 async def debug_admins(m: Message):
     await m.answer(f"ADMINS lus : `{ADMINS}`", parse_mode="Markdown")
 
+@dp.message(Command("debug_sessions"))
+async def debug_sessions(m: Message):
+    if m.from_user.id not in ADMINS:
+        return
+    counts = "\n".join(f"• {ns}: {n}" for ns, n in sessions.live_counts().items())
+    await m.answer(f"Sessions actives :\n{counts}")
+
+# ---------- Commandes (admin): /order, /orders — lues dans l'index local, pas dans Sheets ----------
+
+ORDERS_PAGE = int(os.getenv("ORDERS_PAGE", "15"))  # commandes par message
+_DAY = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_ORDER_FILTER_KEYS = {"d": "day", "u": "user_id", "s": "status"}
+
+def status_code(status: str) -> str:
+    # un statut est du texte libre (longueur, ":"...): callback_data n'en porte qu'une empreinte courte
+    return hashlib.sha1(status.encode()).hexdigest()[:8]
+
+def orders_filter(args: str) -> dict | None:
+    """"today" | "hier" | AAAA-MM-JJ | "user <id>" | "status <statut>" | "" -> filtres de l'index."""
+    parts = args.split()
+    if not parts:
+        return {}
+    kw = parts[0].lower()
+    if len(parts) == 1 and kw in ("today", "aujourdhui", "jour"):
+        return {"day": time.strftime("%Y-%m-%d")}
+    if len(parts) == 1 and kw in ("yesterday", "hier"):
+        return {"day": time.strftime("%Y-%m-%d", time.localtime(time.time() - 86400))}
+    if len(parts) == 1 and _DAY.match(kw):
+        return {"day": kw}
+    if len(parts) == 2 and kw in ("user", "client") and parts[1].isdigit():
+        return {"user_id": int(parts[1])}
+    if len(parts) == 2 and kw in ("status", "statut"):
+        return {"status": parts[1].lower()}
+    return None
+
+def order_line(o: dict) -> str:
+    when = o["timestamp"] or time.strftime("%Y-%m-%d %H:%M", time.localtime(o["created"]))
+    return f"#{o['order_id']} · {when[:16]} · {o['name'] or '?'} ({o['user_id']}) · {money(o['total_cents'])} · {o['status']}"
+
+async def send_orders_page(m: Message, filters: dict, before: int | None = None):
+    found, next_before = order_index.page(**filters, before=before, limit=ORDERS_PAGE)
+    if before is None:
+        count, total = order_index.summary(**filters)
+        label = (f"du {filters['day']}" if "day" in filters else f"du client {filters['user_id']}" if "user_id" in filters
+                 else f"au statut « {filters['status']} »" if "status" in filters else "récentes")
+        head = f"📦 Commandes {label} : {count} — {money(total)}"
+    else:
+        head = "📦 Suite :"
+    if not found:
+        await m.answer(head + "\nAucune commande."); return
+    kb = None
+    if next_before is not None:
+        key, val = next(((k, filters[f]) for k, f in _ORDER_FILTER_KEYS.items() if f in filters), ("a", ""))
+        if key == "s":
+            val = status_code(val)
+        kb = InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="Suivantes ▶️", callback_data=f"ords:{key}:{val}:{next_before}")
+        ]])
+    await m.answer(head + "\n" + "\n".join(order_line(o) for o in found), reply_markup=kb)
+
+@dp.message(Command("order"))
+async def order_cmd(m: Message, command: CommandObject):
+    if m.from_user.id not in ADMINS:
+        return
+    arg = (command.args or "").strip().lstrip("#")
+    o = order_index.get(int(arg)) if arg.isdigit() else None
+    if not o:
+        await m.answer("Usage : /order <numéro>" if not arg.isdigit() else f"Commande #{arg} introuvable dans l’index."); return
+    try:
+        items = json.loads(o["items_json"] or "[]")
+        lines = [f"• {it['name']}{(' • ' + it['color']) if it.get('color') else ''} • T.{it['size']} × {it['qty']}"
+                 for it in items]
+    except (ValueError, TypeError, KeyError):
+        lines = [o["items_json"]]
+    await m.answer(
+        f"🧾 Commande #{o['order_id']} — {o['status']}\n"
+        f"{o['timestamp'] or time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(o['created']))}\n"
+        f"{o['name']} — {o['phone']} (id {o['user_id']})\n"
+        f"Adresse: {o['address']}\n" + "\n".join(lines) + f"\nTotal: {money(o['total_cents'])}",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="Commandes du client", callback_data=f"ords:u:{o['user_id']}:")
+        ]]) if o["user_id"] is not None else None
+    )
+
+@dp.message(Command("orders"))
+async def orders_cmd(m: Message, command: CommandObject):
+    if m.from_user.id not in ADMINS:
+        return
+    args = (command.args or "").strip()
+    if args.lower() == "sync":
+        try:
+            n = await backfill_order_index()
+        except Exception as e:
+            await m.answer(f"Relecture de l’onglet Orders impossible : {e}"); return
+        await m.answer(f"Index des commandes à jour : {n} commande(s) relue(s)."); return
+    filters = orders_filter(args)
+    if filters is None:
+        await m.answer("Usage : /orders [today | hier | AAAA-MM-JJ | user <id> | status <statut> | sync]"); return
+    await send_orders_page(m, filters)
+
+@dp.callback_query(F.data.startswith("ords:"))
+async def orders_more(cb: CallbackQuery):
+    if cb.from_user.id not in ADMINS:
+        await cb.answer(); return
+    _, key, val, before = cb.data.split(":", 3)
+    filters = {}
+    if key == "s":
+        status = next((s for s in order_index.statuses() if status_code(s) == val), None)
+        if status is None:
+            await cb.answer("Plus aucune commande à ce statut.", show_alert=True); return
+        filters["status"] = status
+    elif key in _ORDER_FILTER_KEYS:
+        filters[_ORDER_FILTER_KEYS[key]] = int(val) if key == "u" else val
+    await cb.answer()
+    if before:
+        await views.set_markup(cb.message, None)
+    await send_orders_page(cb.message, filters, before=int(before) if before else None)
+
 # ---------------------------- Handlers ----------------------------
 
+@dp.message(CommandStart(deep_link=True, magic=F.args.regexp(r"^p_\d+$")))
+async def start_product(m: Message, command: CommandObject):
+    # lien t.me/<bot>?start=p_<pid> (résultats inline)
+    catalog = await get_catalog_async()
+    p = catalog.get(int(command.args[2:]))
+    if not p:
+        await start(m); return
+    await send_product(m, catalog, p)
+
 @dp.message(CommandStart())
 async def start(m: Message):
     if m.from_user.id in ADMINS:
@@ -286,16 +571,17 @@ async def start(m: Message):
         "📸 Tu peux aussi envoyer *en privé* la *photo d’un modèle* + ta *taille* à un conseiller.\n\n"
         "Commandes utiles :\n"
         "• /catalogue – Voir les catégories\n"
+        "• /search – Rechercher un modèle\n"
         "• /panier – Voir le panier\n"
         "• /commander – Finaliser la commande\n"
         "• /help – Contacter un conseiller",
         parse_mode="Markdown",
-        reply_markup=cat_kb()
+        reply_markup=await cat_kb()
     )
 
 @dp.message(Command("catalogue"))
 async def cmd_catalog(m: Message):
-    await m.answer("Choisis une catégorie :", reply_markup=cat_kb())
+    await m.answer("Choisis une catégorie :", reply_markup=await cat_kb())
 
 @dp.message(Command("commander"))
 async def cmd_commander(m: Message):
@@ -307,7 +593,7 @@ async def cb_help(cb: CallbackQuery):
 
 @dp.callback_query(F.data == "browse")
 async def browse_again(cb: CallbackQuery):
-    await cb.message.answer("Choisis une catégorie :", reply_markup=cat_kb())
+    await cb.message.answer("Choisis une catégorie :", reply_markup=await cat_kb())
 
 # ---------- NOUVEAU : bouton "photo de modèle" => MP direct + message pré-rempli ----------
 @dp.callback_query(F.data == "custom:askphoto")
@@ -337,11 +623,30 @@ async def ask_photo(cb: CallbackQuery):
 
 # ---------- Catalogue / Produits ----------
 
+def product_caption(p: dict) -> str:
+    colors_line = f"\nColoris: {', '.join(p['colors'])}" if p.get("colors") else ""
+    return (
+        f"**{p['name']}**\n"
+        f"Catégorie: {p['category']}\n"
+        f"Prix: {money(p['price_cents'])}\n"
+        f"Tailles: {p['sizes'] or '—'}{colors_line}"
+    )
+
+def product_kb(pid: int, category: str, next_offset: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="➕ Ajouter (choisir options)", callback_data=f"add:{pid}")],
+        [InlineKeyboardButton(text="Changer d’article", callback_data=f"cat:{category}:{next_offset}")],
+        [InlineKeyboardButton(text="📦 Panier", callback_data="cart:view")],
+        [InlineKeyboardButton(text="⬅️ Retour au catalogue", callback_data="browse")],
+        kb_support_row()
+    ])
+
 @dp.callback_query(F.data.startswith("cat:"))
 async def cat_list(cb: CallbackQuery):
     _, category, off = cb.data.split(":")
     offset = int(off or 0)
-    prods, total = list_products(category if category else None, offset=offset, limit=PAGE_SIZE)
+    catalog = await get_catalog_async()
+    prods, total = catalog.page(category if category else None, offset=offset, limit=PAGE_SIZE)
     if not prods:
         await safe_edit(cb, "Aucun produit.", reply_markup=InlineKeyboardMarkup(
             inline_keyboard=[[InlineKeyboardButton(text="⬅️ Catalogue", callback_data="browse")], kb_support_row()]
@@ -349,31 +654,98 @@ async def cat_list(cb: CallbackQuery):
         return
 
     p = prods[0]
-    colors_line = f"\nColoris: {', '.join(p['colors'])}" if p.get("colors") else ""
-    caption = (
-        f"**{p['name']}**\n"
-        f"Catégorie: {p['category']}\n"
-        f"Prix: {money(p['price_cents'])}\n"
-        f"Tailles: {p['sizes'] or '—'}{colors_line}"
-    )
+    caption = _render.get(catalog.version, ("caption", p["id"]), lambda: product_caption(p))
     next_offset = offset + 1 if (offset + 1) < total else 0
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="➕ Ajouter (choisir options)", callback_data=f"add:{p['id']}")],
-        [InlineKeyboardButton(text="Changer d’article", callback_data=f"cat:{category}:{next_offset}")],
-        [InlineKeyboardButton(text="📦 Panier", callback_data="cart:view")],
-        [InlineKeyboardButton(text="⬅️ Retour au catalogue", callback_data="browse")],
-        kb_support_row()
-    ])
+    kb = _render.get(catalog.version, ("product_kb", p["id"], category, next_offset),
+                     lambda: product_kb(p["id"], category, next_offset))
 
+    await safe_edit(cb, caption, reply_markup=kb, image=get_image_for(p, None) or None)
+
+def product_offset(catalog, p: dict) -> int:
+    """Position de p dans sa catégorie (pour enchaîner sur "Changer d’article")."""
+    return catalog.by_category.get(p["category"], [p]).index(p)
+
+async def send_product(m: Message, catalog, p: dict):
+    """Fiche produit dans un nouveau message (recherche, lien profond)."""
+    caption = _render.get(catalog.version, ("caption", p["id"]), lambda: product_caption(p))
+    total = len(catalog.by_category.get(p["category"], ()))
+    offset = _render.get(catalog.version, ("offset", p["id"]), lambda: product_offset(catalog, p))
+    next_offset = offset + 1 if (offset + 1) < total else 0
+    kb = _render.get(catalog.version, ("product_kb", p["id"], p["category"], next_offset),
+                     lambda: product_kb(p["id"], p["category"], next_offset))
     img = get_image_for(p, None)
     if img:
         try:
-            await cb.message.edit_media(InputMediaPhoto(media=img, caption=caption, parse_mode="Markdown"))
-            await cb.message.edit_reply_markup(reply_markup=kb)
-        except TelegramBadRequest:
-            await safe_edit(cb, caption, reply_markup=kb)
+            res = await m.answer_photo(await photo_input(img), caption=caption, parse_mode="Markdown", reply_markup=kb)
+            remember(img, res)
+            views.record(res, img, caption, kb)
+            return
+        except TelegramBadRequest as e:
+            if is_media_error(e):
+                forget(img)
+    res = await m.answer(caption, parse_mode="Markdown", reply_markup=kb)
+    views.record(res, None, caption, kb)
+
+# ---------- Recherche: /search et mode inline ----------
+
+def search_kb(results: list[dict]) -> InlineKeyboardMarkup:
+    rows = [[InlineKeyboardButton(text=f"{p['name']} — {money(p['price_cents'])}", callback_data=f"show:{p['id']}")]
+            for p in results]
+    rows.append([InlineKeyboardButton(text="⬅️ Retour au catalogue", callback_data="browse")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+@dp.message(Command("search"))
+async def search_cmd(m: Message, command: CommandObject):
+    query = (command.args or "").strip()
+    if not query:
+        await m.answer("🔎 Écris `/search` suivi d’un mot : nom, catégorie ou coloris (ex: `/search basket noir`).\n"
+                       "Tu peux aussi taper `@" + (await bot.me()).username + " basket` dans n’importe quelle conversation.",
+                       parse_mode="Markdown")
+        return
+    catalog = await get_catalog_async()
+    results = search_index.search(catalog, query, limit=SEARCH_RESULTS)
+    if not results:
+        await m.answer("Aucun produit ne correspond à ta recherche.", reply_markup=await cat_kb())
+        return
+    if len(results) == 1:
+        await send_product(m, catalog, results[0]); return
+    await m.answer(f"🔎 Résultats pour « {query} » :", reply_markup=search_kb(results))
+
+@dp.callback_query(F.data.startswith("show:"))
+async def show_product(cb: CallbackQuery):
+    catalog = await get_catalog_async()
+    p = catalog.get(int(cb.data.split(":")[1]))
+    if not p:
+        await cb.answer("Produit introuvable", show_alert=True); return
+    await cb.answer()
+    await send_product(cb.message, catalog, p)
+
+def inline_result(p: dict, username: str):
+    caption = product_caption(p)
+    kb = InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="🛍️ Voir dans la boutique", url=f"https://t.me/{username}?start=p_{p['id']}")
+    ]])
+    desc = f"{money(p['price_cents'])} • {p['category']}"
+    img = get_image_for(p, None)
+    if img.startswith(("http://", "https://")):
+        return InlineQueryResultPhoto(id=str(p["id"]), photo_url=img, thumbnail_url=img, title=p["name"],
+                                      description=desc, caption=caption, parse_mode="Markdown", reply_markup=kb)
+    return InlineQueryResultArticle(id=str(p["id"]), title=p["name"], description=desc, reply_markup=kb,
+                                    input_message_content=InputTextMessageContent(message_text=caption, parse_mode="Markdown"))
+
+@dp.inline_query()
+async def inline_search(q: InlineQuery):
+    catalog = await get_catalog_async()
+    offset = int(q.offset or 0)
+    query = q.query.strip()
+    if query:
+        results = search_index.search(catalog, query, limit=50, offset=offset)
     else:
-        await safe_edit(cb, caption, reply_markup=kb)
+        results = catalog.products[offset: offset+50]
+    username = (await bot.me()).username
+    items = [_render.get(catalog.version, ("inline", p["id"]), lambda p=p: inline_result(p, username)) for p in results]
+    await q.answer(items, cache_time=SEARCH_INLINE_CACHE, is_personal=False,
+                   next_offset=str(offset + 50) if len(results) == 50 else "")
 
 # ---------- Sélection produit: coloris -> VALIDATION -> saisie de taille ----------
 
@@ -383,15 +755,34 @@ def colors_keyboard(pid: int, colors: list[str]) -> InlineKeyboardMarkup:
     rows.append(kb_support_row())
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
+async def cached_colors_keyboard(p: dict) -> InlineKeyboardMarkup:
+    catalog = await get_catalog_async()
+    return _render.get(catalog.version, ("colors_kb", p["id"]), lambda: colors_keyboard(p["id"], p["colors"]))
+
+def color_confirm_view(p: dict, color: str, color_enc: str):
+    caption = (
+        f"**{p['name']}**\n"
+        f"Couleur choisie: *{color}*\n"
+        f"Prix: {money(p['price_cents'])}\n\n"
+        "Valider ce coloris ?"
+    )
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Valider ce coloris", callback_data=f"confirm_color:{p['id']}:{color_enc}")],
+        [InlineKeyboardButton(text="↩️ Choisir un autre coloris", callback_data=f"colors:{p['id']}")],
+        [InlineKeyboardButton(text="⬅️ Retour au catalogue", callback_data="browse")],
+        kb_support_row()
+    ])
+    return caption, kb
+
 @dp.callback_query(F.data.startswith("add:"))
 async def add_choose_options(cb: CallbackQuery):
     pid = int(cb.data.split(":")[1])
-    p = get_product(pid)
+    p = await get_product_async(pid)
     if not p:
         await cb.answer("Produit introuvable", show_alert=True); return
 
     if p.get("colors"):
-        await cb.message.edit_reply_markup(reply_markup=colors_keyboard(pid, p["colors"]))
+        await views.set_markup(cb.message, await cached_colors_keyboard(p))
         await cb.answer("Choisis un coloris", show_alert=False)
     else:
         manual_size_wait[cb.from_user.id] = {"pid": pid, "color": None}
@@ -405,48 +796,32 @@ async def choose_color(cb: CallbackQuery):
     _, pid_str, color_enc = cb.data.split(":")
     pid = int(pid_str)
     color = urllib.parse.unquote(color_enc)
-    p = get_product(pid)
+    catalog = await get_catalog_async()
+    p = catalog.get(pid)
     if not p:
         await cb.answer("Produit introuvable", show_alert=True); return
 
     # Afficher l'image du coloris + demander validation
     img = get_image_for(p, color)
-    caption = (
-        f"**{p['name']}**\n"
-        f"Couleur choisie: *{color}*\n"
-        f"Prix: {money(p['price_cents'])}\n\n"
-        "Valider ce coloris ?"
-    )
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Valider ce coloris", callback_data=f"confirm_color:{pid}:{color_enc}")],
-        [InlineKeyboardButton(text="↩️ Choisir un autre coloris", callback_data=f"colors:{pid}")],
-        [InlineKeyboardButton(text="⬅️ Retour au catalogue", callback_data="browse")],
-        kb_support_row()
-    ])
-    try:
-        if img:
-            await cb.message.edit_media(InputMediaPhoto(media=img, caption=caption, parse_mode="Markdown"))
-            await cb.message.edit_reply_markup(reply_markup=kb)
-        else:
-            await safe_edit(cb, caption, reply_markup=kb)
-    except TelegramBadRequest:
-        await safe_edit(cb, caption, reply_markup=kb)
+    caption, kb = _render.get(catalog.version, ("color_view", pid, color_enc),
+                              lambda: color_confirm_view(p, color, color_enc))
+    await safe_edit(cb, caption, reply_markup=kb, image=img or None)
 
 @dp.callback_query(F.data.startswith("colors:"))
 async def list_colors_again(cb: CallbackQuery):
     pid = int(cb.data.split(":")[1])
-    p = get_product(pid)
+    p = await get_product_async(pid)
     if not p or not p.get("colors"):
         await cb.answer("Aucun coloris disponible.", show_alert=True)
         return
-    await cb.message.edit_reply_markup(reply_markup=colors_keyboard(pid, p["colors"]))
+    await views.set_markup(cb.message, await cached_colors_keyboard(p))
 
 @dp.callback_query(F.data.startswith("confirm_color:"))
 async def confirm_color(cb: CallbackQuery):
     _, pid_str, color_enc = cb.data.split(":")
     pid = int(pid_str)
     color = urllib.parse.unquote(color_enc)
-    p = get_product(pid)
+    p = await get_product_async(pid)
     if not p:
         await cb.answer("Produit introuvable", show_alert=True); return
 
@@ -489,7 +864,7 @@ async def on_text(m: Message):
     if uid in manual_size_wait and not stage_hint:
         entry = manual_size_wait.pop(uid)
         pid = entry["pid"]; color = entry.get("color")
-        p = get_product(pid)
+        p = await get_product_async(pid)
         if not p:
             await m.answer("Produit introuvable."); return
         size_text = m.text.strip()
@@ -507,18 +882,18 @@ async def on_text(m: Message):
     if user_checkout.get(uid, {}).get("_active") or stage_hint:
         stage = stage_get(uid) or stage_hint
         if stage == "name":
-            _get_or_init_checkout(uid); user_checkout[uid]["name"] = m.text.strip()
+            checkout_update(uid, name=m.text.strip())
             await prompt_phone(m); return
         if stage == "phone":
             if any(ch.isdigit() for ch in m.text):
-                _get_or_init_checkout(uid); user_checkout[uid]["phone"] = m.text.strip()
+                checkout_update(uid, phone=m.text.strip())
                 await prompt_address(m)
             else:
                 await m.answer("Merci d'envoyer un *numéro de téléphone* valide ou d'utiliser le bouton ci-dessous.",
                                parse_mode="Markdown", reply_markup=phone_kb())
             return
         if stage == "address":
-            _get_or_init_checkout(uid); user_checkout[uid]["address"] = m.text.strip()
+            checkout_update(uid, address=m.text.strip())
             await finalize_order(m, uid); return
 
     # 3) Message libre
@@ -539,7 +914,7 @@ async def cart_view_cb(cb: CallbackQuery):
 
 async def cart_view(ev):
     uid = ev.from_user.id
-    items = carts[uid]
+    items = get_cart(uid)
     if not items:
         await safe_edit(ev, "Ton panier est vide.\n\nRetour au catalogue :", reply_markup=InlineKeyboardMarkup(
             inline_keyboard=[[InlineKeyboardButton(text="⬅️ Catalogue", callback_data="browse")], kb_support_row()]
@@ -586,24 +961,60 @@ async def got_contact(m: Message):
     if not user_checkout.get(uid, {}).get("_active"):
         user_checkout[uid] = {"_active": True}
         await prompt_name(m); return
-    user_checkout[uid]["phone"] = m.contact.phone_number
+    checkout_update(uid, phone=m.contact.phone_number)
     if "name" not in user_checkout[uid]:
         await prompt_name(m)
     else:
         await prompt_address(m)
 
 # ---------- Finalisation ----------
+def order_fingerprint(items, u: dict) -> str:
+    payload = [items.to_list(), u.get("name", ""), u.get("phone", ""), u.get("address", "")]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+async def send_order_confirmation(m: Message, order_id: int, total: int):
+    await m.answer(
+        f"✅ Commande #{order_id} enregistrée.\n"
+        f"Total: *{total/100:.2f} €*\n\n"
+        "Clique pour *payer via PayPal.me*. "
+        "Si possible, sélectionne **Entre proches** dans l’app et ajoute la note:\n"
+        f"`Commande #{order_id}`",
+        parse_mode="Markdown",
+        reply_markup=payment_kb(order_id, total)
+    )
+
 async def finalize_order(m: Message, uid: int):
+    # une adresse envoyée deux fois (même worker ou un autre) renvoie la
+    # confirmation de la commande déjà créée au lieu d'en écrire une seconde
     u = user_checkout.get(uid, {})
-    items = carts[uid]
+    items = get_cart(uid)
+    now = time.time()
+    fp = order_fingerprint(items, u) if items else None
+    total = cart_total_cents(uid) if items else 0
+    order_id = orders.next_order_id() if items else None
+    dup = []
+
+    def claim(done):
+        # lu et écrit dans la même transaction du store partagé: un seul worker gagne
+        if done and now - done["at"] < ORDER_DEDUP_WINDOW and (not items or done["fp"] == fp):
+            dup.append(done)
+            return done
+        if not items:
+            return done
+        return {"fp": fp, "order_id": order_id, "total": total, "at": now}
+
+    last_order.mutate(uid, claim)
+    if dup:
+        await send_order_confirmation(m, dup[0]["order_id"], dup[0]["total"])
+        empty_cart(uid)
+        user_checkout.pop(uid, None); checkout_prompt.pop(uid, None)
+        return
     if not items:
         await m.answer("Ton panier est vide.", reply_markup=InlineKeyboardMarkup(
             inline_keyboard=[[InlineKeyboardButton(text="⬅️ Catalogue", callback_data="browse")], kb_support_row()])
         )
         user_checkout.pop(uid, None); checkout_prompt.pop(uid, None)
         return
-    total = cart_total_cents(uid)
-    order_id = int(time.time())
     order = {
         "order_id": order_id,
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
@@ -611,28 +1022,15 @@ async def finalize_order(m: Message, uid: int):
         "name": u.get("name", ""),
         "phone": u.get("phone", ""),
         "address": u.get("address", ""),
-        "items_json": items,
+        "items_json": items.to_list(),  # copie: le panier est vidé avant l'écriture Sheets
         "total_cents": total,
         "status": "new",
     }
-    append_order(order)
+    orders.submit(order)  # journal local; l'écriture Sheets se fait en tâche de fond
 
-    sent = await notify_admins_order_with_photos(order, items)
+    spawn(notify_order_in_background(order, order["items_json"], m.chat.id))
 
-    await m.answer(
-        f"✅ Commande #{order_id} enregistrée.\n"
-        f"Total: *{total/100:.2f} €*\n\n"
-        "Clique pour *payer via PayPal.me*. "
-        "Si possible, sélectionne **Entre proches** dans l’app et ajoute la note:\n"
-        f"`Commande #{order_id}`",
-        parse_mode="Markdown",
-        reply_markup=payment_kb(order_id, total)
-    )
-    if sent == 0:
-        await m.answer(
-            "ℹ️ Note : je n’ai pas pu notifier l’admin en MP. Il devra *démarrer le bot* et vérifier `ADMINS`.",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[kb_support_row()])
-        )
+    await send_order_confirmation(m, order_id, total)
 
     empty_cart(uid)
     user_checkout.pop(uid, None); checkout_prompt.pop(uid, None)
@@ -659,6 +1057,27 @@ async def paypal_howto(cb: CallbackQuery):
 
 # ---------------------------- Run ----------------------------
 
+async def sync_order_index():
+    try:
+        n = await backfill_order_index()
+        print(f"[ORDER INDEX] {n} commande(s) chargée(s) depuis l’onglet Orders")
+    except Exception as e:
+        print(f"[ORDER INDEX ERROR] backfill: {e}")
+
+@dp.startup()
+async def on_startup():
+    orders.start()
+    sessions.start()
+    media.start()
+    spawn(sync_order_index())  # en fond: l'index reste utilisable (commandes du process) pendant la lecture
+
+@dp.shutdown()
+async def on_shutdown():
+    await orders.stop()
+    await sessions.stop()
+    await media.stop()
+    state_store.flush()
+
 async def main():
     await dp.start_polling(bot, polling_timeout=60)
 
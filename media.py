@@ -0,0 +1,124 @@
+# media.py — cache persistant URL d'image -> file_id Telegram
+# Le premier envoi d'une image passe par son URL (Drive); Telegram renvoie un
+# file_id qu'on réutilise ensuite pour les envois, les edit_media et les
+# notifications admin (valable pour tous les chats du même bot). Sans file_id,
+# on envoie la version locale pré-traitée (images.py), l'URL en dernier recours.
+# Le fichier est réécrit en arrière-plan (toutes les FILE_ID_FLUSH_INTERVAL s et
+# à l'arrêt), jamais sur la boucle d'événements à chaque nouveau file_id.
+import os, json, asyncio, threading
+
+from sheets import on_catalog_change
+from images import local_photo
+
+FILE_ID_CACHE = os.getenv("FILE_ID_CACHE", "file_ids.json")
+FILE_ID_FLUSH_INTERVAL = float(os.getenv("FILE_ID_FLUSH_INTERVAL", "10"))
+
+_lock = threading.Lock()
+_file_ids: dict[str, str] = {}
+_dirty = False
+_task: asyncio.Task | None = None
+
+def _load():
+    if not FILE_ID_CACHE or not os.path.exists(FILE_ID_CACHE):
+        return
+    try:
+        with open(FILE_ID_CACHE, encoding="utf-8") as f:
+            _file_ids.update(json.load(f))
+    except (OSError, ValueError) as e:
+        print(f"[FILE_ID CACHE ERROR] {e}")
+
+def _write(data: dict[str, str]) -> bool:
+    tmp = f"{FILE_ID_CACHE}.{os.getpid()}.tmp"  # un fichier temporaire par worker, remplacement atomique
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, FILE_ID_CACHE)
+        return True
+    except OSError as e:
+        print(f"[FILE_ID CACHE ERROR] {e}")
+        return False
+
+def _save():
+    global _dirty
+    _dirty = True
+
+async def flush():
+    """Écrit le cache s'il a changé (dans un thread, pas sur la boucle)."""
+    global _dirty
+    if not FILE_ID_CACHE or not _dirty:
+        return
+    with _lock:
+        data, _dirty = dict(_file_ids), False
+    if not await asyncio.get_running_loop().run_in_executor(None, _write, data):
+        _dirty = True  # nouvel essai au prochain tour
+
+def photo_ref(url: str) -> str:
+    """file_id déjà connu pour cette URL, sinon l'URL elle-même."""
+    return _file_ids.get(url, url)
+
+async def photo_input(url: str):
+    """Ce qu'il faut passer à Telegram: file_id, sinon octets locaux, sinon URL."""
+    fid = _file_ids.get(url)
+    if fid:
+        return fid
+    return await local_photo(url) or url
+
+def file_id_of(message) -> str | None:
+    photos = getattr(message, "photo", None)
+    return photos[-1].file_id if photos else None
+
+_MEDIA_ERRORS = ("wrong file identifier", "wrong remote file identifier", "failed to get http url content",
+                 "wrong type of the web page content", "wrong file_id")
+
+def is_media_error(e: Exception) -> bool:
+    """Erreur Telegram due au média lui-même (file_id périmé, URL illisible), pas au destinataire."""
+    msg = str(e).lower()
+    return any(s in msg for s in _MEDIA_ERRORS)
+
+def remember(url: str, message) -> None:
+    """Mémorise le file_id du message envoyé/édité à partir de url."""
+    fid = file_id_of(message)
+    if not url or not fid or _file_ids.get(url) == fid:
+        return
+    with _lock:
+        _file_ids[url] = fid
+        _save()
+
+def forget(url: str) -> None:
+    with _lock:
+        if _file_ids.pop(url, None) is not None:
+            _save()
+
+@on_catalog_change
+def _prune(catalog):
+    # une URL qui a disparu du catalogue (image remplacée) ne sert plus
+    urls = set(catalog.image_urls())
+    with _lock:
+        stale = [u for u in _file_ids if u not in urls]
+        for u in stale:
+            del _file_ids[u]
+        if stale:
+            _save()
+
+async def _flusher():
+    while True:
+        await asyncio.sleep(FILE_ID_FLUSH_INTERVAL)
+        await flush()
+
+def start():
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(_flusher())
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    await flush()
+
+_load()
@@ -0,0 +1,170 @@
+# metrics.py — métriques en mémoire, exposées au format texte Prometheus (/metrics)
+# Volontairement sans dépendance: compteurs, jauges et histogrammes à labels,
+# utilisables depuis la boucle asyncio comme depuis les threads du pool Sheets.
+import time, threading
+from contextlib import contextmanager
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list = []
+
+def _esc(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labels
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}{_fmt_labels(self.labelnames, k)} {v}" for k, v in items]
+
+class Gauge(_Metric):
+    """Jauge fixée à la main (set) ou lue au moment du scrape (fn)."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+        self._fn = fn  # fn() -> float, ou {labels_tuple: float} si labels
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def set_function(self, fn):
+        self._fn = fn
+
+    def render(self) -> list[str]:
+        if self._fn is not None:
+            try:
+                v = self._fn()
+            except Exception:
+                v = None
+            if isinstance(v, dict):
+                items = list(v.items())
+            else:
+                items = [((), v)] if v is not None else []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self._header() + [f"{self.name}{_fmt_labels(self.labelnames, k)} {v}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._data: dict[tuple, list] = {}  # labels -> [compteurs par bucket..., somme, total]
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            d = self._data.get(labels)
+            if d is None:
+                d = self._data[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    d[i] += 1
+            d[-2] += value
+            d[-1] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = [(k, list(d)) for k, d in self._data.items()]
+        out = self._header()
+        for k, d in items:
+            for b, c in zip(self.buckets, d):
+                le = f'le="{b}"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, k, le)} {c}")
+            inf = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, k, inf)} {d[-1]}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, k)} {d[-2]}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, k)} {d[-1]}")
+        return out
+
+def render() -> str:
+    lines = []
+    for m in _registry:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- métriques du bot ---------------------------------------------------------------
+
+HANDLER_LATENCY = Histogram("bot_handler_seconds", "Durée de traitement d'un update par handler", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Updates terminés en exception", ("handler",))
+
+SHEETS_LATENCY = Histogram("sheets_call_seconds", "Durée des appels Google Sheets", ("op",))
+SHEETS_ERRORS = Counter("sheets_errors_total", "Appels Google Sheets en erreur", ("op",))
+PRODUCTS_CACHE = Counter("products_cache_requests_total",
+                         "Lectures du catalogue: hit (frais), stale (servi + revalidation), miss (attente)",
+                         ("result",))
+
+TELEGRAM_CALLS = Counter("telegram_api_calls_total", "Appels Bot API", ("method",))
+TELEGRAM_LATENCY = Histogram("telegram_api_seconds", "Durée des appels Bot API", ("method",))
+TELEGRAM_ERRORS = Counter("telegram_api_errors_total", "Appels Bot API en erreur", ("method", "error"))
+TELEGRAM_RETRY_AFTER = Counter("telegram_retry_after_total", "Réponses 429 (retry_after) de Telegram", ("method",))
+
+WEBHOOK_QUEUE_DEPTH = Gauge("webhook_queue_depth", "Updates en attente dans la file du webhook")
+
+@contextmanager
+def sheets_call(op: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SHEETS_ERRORS.inc(op)
+        raise
+    finally:
+        SHEETS_LATENCY.observe(time.perf_counter() - t0, op)
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware de session aiogram: compte et chronomètre chaque appel Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        TELEGRAM_CALLS.inc(name)
+        t0 = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            TELEGRAM_RETRY_AFTER.inc(name)
+            TELEGRAM_ERRORS.inc(name, "TelegramRetryAfter")
+            raise
+        except TelegramAPIError as e:
+            TELEGRAM_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_LATENCY.observe(time.perf_counter() - t0, name)
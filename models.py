@@ -1,23 +1,110 @@
 # models.py
-from collections import defaultdict
+from sessions import SessionMap
 
-# panier: {user_id: [{"id":..., "name":..., "color":"Black", "size":"42", "qty":1, "price_cents":5999}]}
-carts = defaultdict(list)
+class CartLine:
+    """Ligne de panier; se lit aussi comme un dict (line["qty"], line.get("color"))."""
+    __slots__ = ("id", "name", "color", "size", "qty", "price_cents")
+    FIELDS = __slots__
 
+    def __init__(self, id, name, color, size, qty, price_cents):
+        self.id = id
+        self.name = name
+        self.color = color
+        self.size = size
+        self.qty = qty
+        self.price_cents = price_cents
+
+    @property
+    def key(self):
+        return (self.id, self.color, self.size)
+
+    def __getitem__(self, k):
+        if k not in self.FIELDS:
+            raise KeyError(k)
+        return getattr(self, k)
+
+    def get(self, k, default=None):
+        return getattr(self, k) if k in self.FIELDS else default
+
+    def to_dict(self) -> dict:
+        return {f: getattr(self, f) for f in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "CartLine":
+        return cls(d["id"], d.get("name", ""), d.get("color"), d["size"], d.get("qty", 1), d["price_cents"])
+
+class Cart:
+    """Lignes dans l'ordre d'ajout, index (id, couleur, taille) -> ligne et total tenu à jour."""
+    __slots__ = ("lines", "_index", "total_cents")
+
+    def __init__(self, lines=()):
+        self.lines: list[CartLine] = []
+        self._index: dict[tuple, CartLine] = {}
+        self.total_cents = 0
+        for line in lines:
+            self.add(line)
+
+    def add(self, item) -> CartLine:
+        line = item if isinstance(item, CartLine) else CartLine.from_dict(item)
+        # fusion si même produit + même couleur + même taille
+        same = self._index.get(line.key)
+        if same is not None:
+            same.qty += line.qty
+        else:
+            self.lines.append(line)
+            self._index[line.key] = line
+        self.total_cents += line.price_cents * line.qty
+        return same or line
+
+    def remove(self, index: int):
+        if 0 <= index < len(self.lines):
+            line = self.lines.pop(index)
+            del self._index[line.key]
+            self.total_cents -= line.price_cents * line.qty
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def to_list(self) -> list[dict]:
+        return [line.to_dict() for line in self.lines]
+
+    @classmethod
+    def from_list(cls, items) -> "Cart":
+        return cls(CartLine.from_dict(d) for d in items)
+
+_EMPTY_CART = Cart()
+
+# panier: {user_id: Cart}; sérialisé en [{"id":..., "name":..., "color":"Black", "size":"42", "qty":1, "price_cents":5999}]
+# (voir storage.py: toute modification doit être réaffectée, ou passer par carts.mutate)
+# expiré après 7 jours sans activité de l'utilisateur (SESSION_TTL_CART)
+carts = SessionMap("cart", ttl=7 * 24 * 3600, refresh_on_activity=True, codec=(Cart.to_list, Cart.from_list))
+
+def get_cart(user_id) -> Cart:
+    """Panier de l'utilisateur; un panier vide n'est jamais stocké (lecture sans effet de bord)."""
+    return carts.get(user_id) or _EMPTY_CART
+
+# lecture-modification-écriture atomique (carts.mutate): deux workers qui ajoutent
+# en même temps au même panier ne s'écrasent pas
 def add_to_cart(user_id, item):
-    # fusion si même produit + même couleur + même taille
-    for i in carts[user_id]:
-        if i["id"] == item["id"] and i.get("color") == item.get("color") and i["size"] == item["size"]:
-            i["qty"] += item.get("qty", 1)
-            return
-    carts[user_id].append(item)
+    def add(cart):
+        cart = cart or Cart()
+        cart.add(item)
+        return cart
+    carts.mutate(user_id, add)
 
 def remove_from_cart(user_id, index):
-    if 0 <= index < len(carts[user_id]):
-        carts[user_id].pop(index)
+    def remove(cart):
+        if cart is None:
+            return None
+        cart.remove(index)
+        return cart or None  # panier vidé: supprimé
+    carts.mutate(user_id, remove)
 
 def empty_cart(user_id):
-    carts[user_id].clear()
+    carts.pop(user_id, None)
 
 def cart_total_cents(user_id):
-    return sum(i["price_cents"] * i["qty"] for i in carts[user_id])
+    return get_cart(user_id).total_cents
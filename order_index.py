@@ -0,0 +1,152 @@
+# order_index.py — miroir local et indexé de l'onglet Orders (SQLite)
+# Retrouver une commande dans Sheets oblige à relire tout l'onglet (et consomme
+# du quota). On garde une copie locale: alimentée à chaque commande journalisée
+# (orders.submit, le chemin qui mène à append_orders) et rechargée depuis
+# l'onglet au démarrage ou via /orders sync. Index sur order_id (clé), user_id,
+# status et date: /order et /orders répondent en quelques millisecondes.
+import os, json, time, sqlite3, datetime, threading
+
+import orders
+from sheets import fetch_orders_async
+
+ORDER_INDEX_DB = os.getenv("ORDER_INDEX_DB", "orders_index.db")
+
+_LEGACY_ID_MAX = 1 << 31  # anciens identifiants: int(time.time())
+
+def _to_int(v):
+    try:
+        return int(str(v).strip())
+    except (TypeError, ValueError):
+        return None
+
+def created_at(order_id: int) -> float:
+    """Date (epoch) d'une commande, déduite de son identifiant (ancien ou nouveau format)."""
+    return float(order_id) if order_id < _LEGACY_ID_MAX else float(orders.order_time(order_id))
+
+def day_bounds(day: str) -> tuple[float, float]:
+    """[début, fin) du jour local "AAAA-MM-JJ" en epoch."""
+    d = datetime.date.fromisoformat(day)
+    start = time.mktime((d.year, d.month, d.day, 0, 0, 0, 0, 0, -1))
+    n = d + datetime.timedelta(days=1)
+    return start, time.mktime((n.year, n.month, n.day, 0, 0, 0, 0, 0, -1))
+
+def _row(order: dict) -> tuple | None:
+    oid = _to_int(order.get("order_id"))
+    if oid is None or oid <= 0:
+        return None
+    items = order.get("items_json", [])
+    if not isinstance(items, str):
+        items = json.dumps(items, ensure_ascii=False)
+    return (oid, created_at(oid), _to_int(order.get("user_id")),
+            (str(order.get("status") or "new")).strip().lower(), _to_int(order.get("total_cents")) or 0,
+            str(order.get("timestamp") or ""), str(order.get("name") or ""), str(order.get("phone") or ""),
+            str(order.get("address") or ""), items)
+
+_FIELDS = ("order_id", "created", "user_id", "status", "total_cents", "timestamp", "name", "phone", "address",
+           "items_json")
+
+class OrderIndex:
+    """Table orders en WAL; les écritures viennent des commandes du process et de l'onglet Orders."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            " order_id INTEGER PRIMARY KEY, created REAL NOT NULL, user_id INTEGER, status TEXT NOT NULL,"
+            " total_cents INTEGER NOT NULL, timestamp TEXT, name TEXT, phone TEXT, address TEXT, items_json TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS orders_user ON orders(user_id, order_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS orders_status ON orders(status, order_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS orders_created ON orders(created)")
+
+    def add_many(self, items: list[dict]) -> int:
+        """Insère/remplace des commandes en une transaction; renvoie le nombre de lignes valides."""
+        rows = [r for r in map(_row, items) if r]
+        if not rows:
+            return 0
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(f"INSERT OR REPLACE INTO orders({','.join(_FIELDS)}) "
+                                     f"VALUES ({','.join('?' * len(_FIELDS))})", rows)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def add(self, order: dict):
+        self.add_many([order])
+
+    def get(self, order_id: int) -> dict | None:
+        with self._lock:
+            row = self._db.execute(f"SELECT {','.join(_FIELDS)} FROM orders WHERE order_id=?",
+                                   (order_id,)).fetchone()
+        return dict(zip(_FIELDS, row)) if row else None
+
+    def _where(self, day: str | None, user_id: int | None, status: str | None) -> tuple[list[str], list]:
+        clauses, args = [], []
+        if day:
+            clauses.append("created >= ? AND created < ?")
+            args.extend(day_bounds(day))
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            args.append(user_id)
+        if status:
+            clauses.append("status = ?")
+            args.append(status.strip().lower())
+        return clauses, args
+
+    def page(self, day: str | None = None, user_id: int | None = None, status: str | None = None,
+             before: int | None = None, limit: int = 20) -> tuple[list[dict], int | None]:
+        """Commandes les plus récentes d'abord, `limit` à la fois.
+
+        Pagination par clé (order_id < before): chaque page coûte le même prix,
+        même loin dans l'historique. Renvoie (commandes, `before` de la page suivante ou None).
+        """
+        clauses, args = self._where(day, user_id, status)
+        if before is not None:
+            clauses.append("order_id < ?")
+            args.append(before)
+        sql = f"SELECT {','.join(_FIELDS)} FROM orders"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY order_id DESC LIMIT ?"
+        with self._lock:
+            rows = self._db.execute(sql, (*args, limit + 1)).fetchall()
+        found = [dict(zip(_FIELDS, r)) for r in rows[:limit]]
+        return found, (found[-1]["order_id"] if len(rows) > limit else None)
+
+    def summary(self, day: str | None = None, user_id: int | None = None, status: str | None = None) -> tuple[int, int]:
+        """(nombre de commandes, total en centimes) pour ces filtres."""
+        clauses, args = self._where(day, user_id, status)
+        sql = "SELECT COUNT(*), COALESCE(SUM(total_cents), 0) FROM orders"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            return tuple(self._db.execute(sql, args).fetchone())
+
+    def statuses(self) -> list[str]:
+        """Statuts distincts présents dans l'index."""
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT DISTINCT status FROM orders")]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+index = OrderIndex(ORDER_INDEX_DB)
+
+@orders.on_submit
+def _index_order(order):
+    index.add(order)
+
+async def backfill() -> int:
+    """Recharge l'index depuis l'onglet Orders (une lecture) + les commandes pas encore écrites."""
+    rows = await fetch_orders_async()
+    return index.add_many(rows + orders.pending_orders())
@@ -0,0 +1,257 @@
+# orders.py — écriture durable des commandes
+# Chaque commande est d'abord ajoutée à un journal local (append-only, fsync),
+# le client est confirmé tout de suite, puis une tâche de fond pousse les
+# commandes en attente dans l'onglet Orders par lots (append_rows) avec
+# retry/backoff. Au redémarrage, le journal est rejoué: rien n'est perdu si
+# Sheets renvoie des erreurs de quota pendant un pic de ventes.
+import os, glob, json, time, fcntl, asyncio, threading
+
+from sheets import append_orders_async, written_order_ids_async
+
+JOURNAL_PATH = os.getenv("ORDERS_JOURNAL", "orders_journal.jsonl")
+FLUSH_INTERVAL = float(os.getenv("ORDERS_FLUSH_INTERVAL", "2"))  # secondes entre deux lots
+BATCH_SIZE = int(os.getenv("ORDERS_BATCH_SIZE", "50"))
+MAX_BACKOFF = 300.0
+
+# --- identifiants de commande -------------------------------------------------------
+# Entier croissant "à la Snowflake": secondes depuis ORDER_EPOCH | worker | séquence.
+# Unique entre workers tant que chacun a son ORDER_WORKER_ID (0-255), triable par
+# date, et assez court pour une note PayPal (~15 chiffres). Sans ORDER_WORKER_ID,
+# chaque process réserve un numéro libre (voir le journal par worker plus bas):
+# unique sur une même machine/volume; entre conteneurs sans disque partagé, le
+# point de départ aléatoire rend une collision improbable, mais fixer
+# ORDER_WORKER_ID par instance reste la seule garantie.
+ORDER_EPOCH = 1704067200  # 2024-01-01 UTC
+WORKER_BITS, SEQ_BITS = 8, 12
+
+_id_lock = threading.Lock()
+# on démarre "après" la seconde courante: un process redémarré dans la même
+# seconde que son prédécesseur ne peut pas réémettre ses identifiants
+_id_clock = int(time.time()) - ORDER_EPOCH
+_id_seq = (1 << SEQ_BITS) - 1
+
+def next_order_id() -> int:
+    global _id_clock, _id_seq
+    with _id_lock:
+        now = int(time.time()) - ORDER_EPOCH
+        if now > _id_clock:
+            _id_clock, _id_seq = now, 0
+        else:
+            # même seconde, ou horloge qui recule: on avance l'horloge logique
+            _id_seq += 1
+            if _id_seq >> SEQ_BITS:
+                _id_clock, _id_seq = _id_clock + 1, 0
+        return (_id_clock << (WORKER_BITS + SEQ_BITS)) | (ORDER_WORKER_ID << SEQ_BITS) | _id_seq
+
+def order_time(order_id: int) -> float:
+    """Date (epoch) encodée dans un identifiant de commande."""
+    return (order_id >> (WORKER_BITS + SEQ_BITS)) + ORDER_EPOCH
+
+# --- journal par worker -------------------------------------------------------------
+# Chaque process a son journal (orders_journal.<worker>.jsonl) et garde un verrou
+# exclusif (flock sur <journal>.lock) tant qu'il tourne: personne d'autre ne le
+# relit ni ne le compacte. Au démarrage, les journaux dont le verrou est libre
+# (process arrêté, ancien journal unique) sont repris par ce worker puis supprimés.
+
+def _journal_for(worker_id: int) -> str:
+    root, ext = os.path.splitext(JOURNAL_PATH)
+    return f"{root}.{worker_id}{ext}"
+
+def _try_lock(path: str):
+    """Fichier de verrou ouvert et verrouillé, ou None s'il est tenu par un process vivant."""
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+def _journals() -> list[str]:
+    root, ext = os.path.splitext(JOURNAL_PATH)
+    found = glob.glob(glob.escape(root) + ".*" + glob.escape(ext))
+    return found + [JOURNAL_PATH] if os.path.exists(JOURNAL_PATH) else found
+
+def _claim_worker_id():
+    """(numéro de worker, verrou de son journal): ORDER_WORKER_ID, sinon le premier libre."""
+    env = os.getenv("ORDER_WORKER_ID", "").strip()
+    if env:
+        wid = int(env) % (1 << WORKER_BITS)
+        lock = _try_lock(_journal_for(wid) + ".lock")
+        if lock is None:
+            raise RuntimeError(f"ORDER_WORKER_ID={wid} est déjà utilisé par un autre process "
+                               f"({_journal_for(wid)}): donner un ORDER_WORKER_ID distinct à chaque worker")
+        return wid, lock
+    start = int.from_bytes(os.urandom(2), "big")
+    for i in range(1 << WORKER_BITS):
+        wid = (start + i) % (1 << WORKER_BITS)
+        lock = _try_lock(_journal_for(wid) + ".lock")
+        if lock is not None:
+            return wid, lock
+    raise RuntimeError(f"aucun ORDER_WORKER_ID libre (256 process utilisent déjà {JOURNAL_PATH})")
+
+ORDER_WORKER_ID, _journal_lock = _claim_worker_id()
+_journal_path = _journal_for(ORDER_WORKER_ID)
+
+_pending: list[dict] = []   # commandes journalisées mais pas encore dans Sheets
+_wakeup: asyncio.Event | None = None
+_task: asyncio.Task | None = None
+_inflight: asyncio.Task | None = None  # écriture en cours: jamais annulée, attendue par stop()
+_uncertain = False  # le dernier envoi a échoué: les lignes ont peut-être été écrites quand même
+_submit_listeners = []
+
+def on_submit(fn):
+    """Enregistre fn(order), appelé à chaque commande journalisée (index local, etc.)."""
+    _submit_listeners.append(fn)
+    return fn
+
+def _append_journal(entry: dict):
+    with open(_journal_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def _read_journal(path: str) -> list[dict]:
+    """Commandes de `path` pas encore marquées comme écrites dans Sheets."""
+    orders, done = {}, set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # dernière ligne tronquée par un arrêt brutal
+            if entry.get("op") == "order":
+                orders[str(entry["order"]["order_id"])] = entry["order"]
+            elif entry.get("op") == "done":
+                done.update(str(i) for i in entry["ids"])
+    return [o for oid, o in orders.items() if oid not in done]
+
+def replay() -> int:
+    """Recharge les commandes non écrites (ce worker + journaux orphelins), puis compacte le journal."""
+    adopted = []  # (verrou, journal) repris d'un process arrêté
+    for path in _journals():
+        if path == _journal_path:
+            continue
+        lock = _try_lock(path + ".lock")
+        if lock is None:
+            continue  # worker vivant
+        if os.path.exists(path):
+            adopted.append((lock, path))
+        else:
+            lock.close()  # déjà repris par un autre worker
+    known = {str(o["order_id"]) for o in _pending}
+    for path in [_journal_path] + [p for _, p in adopted]:
+        if not os.path.exists(path):
+            continue
+        for o in _read_journal(path):
+            if str(o["order_id"]) not in known:
+                known.add(str(o["order_id"]))
+                _pending.append(o)
+
+    tmp = _journal_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for o in _pending:
+            f.write(json.dumps({"op": "order", "order": o}, ensure_ascii=False, separators=(",", ":")) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _journal_path)
+    # les commandes reprises sont maintenant dans notre journal: on supprime l'orphelin
+    for lock, path in adopted:
+        os.remove(path)
+        os.remove(lock.name)
+        lock.close()
+    return len(_pending)
+
+def pending_count() -> int:
+    return len(_pending)
+
+def pending_orders() -> list[dict]:
+    return list(_pending)
+
+def submit(order: dict):
+    """Journalise la commande (durable) et réveille le flusher; ne touche pas Sheets."""
+    _append_journal({"op": "order", "order": order})
+    _pending.append(order)
+    start()
+    _wakeup.set()
+    for fn in _submit_listeners:
+        try:
+            fn(order)
+        except Exception as e:
+            print(f"[ORDERS LISTENER ERROR] {fn.__name__}: {e}")
+
+async def _write_batch(batch: list[dict]):
+    """Écrit un lot puis le retire de la file; une exception laisse le lot en attente (incertain)."""
+    global _uncertain
+    if _uncertain:
+        # après un timeout/une erreur, Sheets a pu écrire le lot: on ne renvoie que les absents
+        written = await written_order_ids_async()
+        todo = [o for o in batch if str(o["order_id"]) not in written]
+    else:
+        todo = batch
+    _uncertain = True
+    if todo:
+        await append_orders_async(todo)
+    _uncertain = False
+    del _pending[:len(batch)]
+    _append_journal({"op": "done", "ids": [o["order_id"] for o in batch]})
+
+async def _flush_once():
+    global _inflight
+    if _inflight is None or _inflight.done():
+        batch = _pending[:BATCH_SIZE]
+        if not batch:
+            return
+        _inflight = asyncio.get_running_loop().create_task(_write_batch(batch))
+    # shield: annuler le flusher (arrêt) n'interrompt pas une écriture déjà partie
+    await asyncio.shield(_inflight)
+
+async def _flusher():
+    backoff = FLUSH_INTERVAL
+    while True:
+        if not _pending:
+            _wakeup.clear()
+            await _wakeup.wait()
+        await asyncio.sleep(FLUSH_INTERVAL)  # laisse le temps au lot de se remplir
+        try:
+            while _pending:
+                await _flush_once()
+            backoff = FLUSH_INTERVAL
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ORDERS FLUSH ERROR] {len(_pending)} en attente, nouvel essai dans {backoff:.0f}s: {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+def start():
+    global _task, _wakeup
+    if _task is not None and not _task.done():
+        return
+    _wakeup = asyncio.Event()
+    if _pending:
+        _wakeup.set()
+    _task = asyncio.get_running_loop().create_task(_flusher())
+
+async def stop():
+    """Arrête le flusher, attend l'écriture en cours puis tente d'écrire le reste."""
+    global _task
+    if _task is not None:
+        _task.cancel()  # interrompt les attentes; une écriture en vol continue (shield)
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    if _inflight is not None:
+        try:
+            await _inflight
+        except Exception:
+            pass  # lot resté en attente: retenté ci-dessous
+    try:
+        while _pending:
+            await _flush_once()
+    except Exception as e:
+        print(f"[ORDERS FLUSH ERROR] {len(_pending)} commande(s) restent dans le journal: {e}")
+
+replay()
@@ -0,0 +1,105 @@
+# outbound.py — régulation du débit sortant vers la Bot API
+# Telegram tolère ~30 messages/s au total et ~1 message/s par chat; au-delà il
+# répond 429 (retry_after). Ce middleware de session fait patienter chaque appel
+# lié à un chat: seau par chat pour les nouveaux messages, seau global pour tout
+# envoi/édition, servi par ordre de priorité (réponses client avant notifications
+# admin). Un 429 met le chat en pause retry_after secondes puis l'appel est rejoué.
+import os, time, heapq, asyncio, itertools, contextvars
+from contextlib import contextmanager
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+import metrics
+from throttle import TokenBucket, BucketMap
+
+OUTBOUND = os.getenv("OUTBOUND_GOVERNOR", "on").strip().lower() not in ("0", "off", "false", "no")
+GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))   # appels/s, tous chats confondus
+GLOBAL_BURST = float(os.getenv("OUTBOUND_GLOBAL_BURST", "30"))
+CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))        # nouveaux messages/s par chat
+CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+MAX_RETRY_WAIT = float(os.getenv("OUTBOUND_MAX_RETRY_WAIT", "30"))  # au-delà, le 429 remonte à l'appelant
+
+HIGH, LOW = 0, 1  # réponses aux clients / notifications de fond
+_PRIORITY_NAMES = {HIGH: "high", LOW: "low"}
+_priority = contextvars.ContextVar("outbound_priority", default=HIGH)
+
+QUEUE_WAIT = metrics.Histogram("telegram_queue_seconds", "Attente avant envoi imposée par le régulateur sortant",
+                               ("priority",))
+QUEUED = metrics.Gauge("telegram_queue_waiting", "Appels Bot API en attente de créneau global")
+
+@contextmanager
+def background():
+    """Les appels faits dans ce bloc (et les tâches qu'il lance) passent après les réponses client."""
+    token = _priority.set(LOW)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def _is_new_message(name: str) -> bool:
+    return name.startswith(("Send", "Copy", "Forward"))
+
+class OutboundGovernor(BaseRequestMiddleware):
+    def __init__(self):
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.chats = BucketMap(CHAT_RATE, CHAT_BURST)
+        self._paused: dict = {}  # chat_id -> monotonic jusqu'auquel Telegram a demandé d'attendre
+        self._heap: list = []    # (priorité, n°, future)
+        self._seq = itertools.count()
+        self._pump_task: asyncio.Task | None = None
+        QUEUED.set_function(lambda: len(self._heap))
+
+    async def _wait_chat(self, chat_id, name: str):
+        while True:
+            wait = self._paused.get(chat_id, 0) - time.monotonic()
+            if wait <= 0:
+                self._paused.pop(chat_id, None)
+                break
+            await asyncio.sleep(wait)
+        if _is_new_message(name):
+            bucket = self.chats.get(chat_id)
+            while not bucket.take():
+                await asyncio.sleep(bucket.delay())
+
+    async def _pump(self):
+        while self._heap:
+            wait = self.global_bucket.delay()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            _, _, fut = heapq.heappop(self._heap)
+            if not fut.done():
+                self.global_bucket.take()
+                fut.set_result(None)
+        self._pump_task = None
+
+    async def _wait_global(self, priority: int, cost: int):
+        for _ in range(cost):
+            if not self._heap and self.global_bucket.take():
+                continue
+            fut = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._heap, (priority, next(self._seq), fut))
+            if self._pump_task is None:
+                self._pump_task = asyncio.create_task(self._pump())
+            await fut
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if not OUTBOUND or chat_id is None:
+            return await make_request(bot, method)  # answerCallbackQuery, getMe, inline...
+        name = type(method).__name__
+        priority = _priority.get()
+        cost = len(getattr(method, "media", None) or ()) if name == "SendMediaGroup" else 1
+        for attempt in range(MAX_RETRIES + 1):
+            t0 = time.perf_counter()
+            await self._wait_chat(chat_id, name)
+            await self._wait_global(priority, max(cost, 1))
+            QUEUE_WAIT.observe(time.perf_counter() - t0, _PRIORITY_NAMES[priority])
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == MAX_RETRIES or e.retry_after > MAX_RETRY_WAIT:
+                    raise
+                self._paused[chat_id] = max(self._paused.get(chat_id, 0), time.monotonic() + e.retry_after)
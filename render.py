@@ -0,0 +1,36 @@
+# render.py — cache des rendus (claviers, légendes) indexé sur la version du catalogue
+# Un clic de navigation ne fait plus que sélectionner des objets déjà construits;
+# tout est invalidé dès que le catalogue change de version.
+import os
+from collections import OrderedDict
+
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "4096"))
+
+class RenderCache:
+    """LRU {clé: rendu} vidé à chaque changement de version du catalogue."""
+
+    def __init__(self, maxsize: int = RENDER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.version = None
+        self._items: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, key, build):
+        if version != self.version:
+            self._items.clear()
+            self.version = version
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            value = self._items[key] = build()
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+            return value
+        self.hits += 1
+        self._items.move_to_end(key)
+        return value
+
+    def __len__(self):
+        return len(self._items)
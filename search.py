@@ -0,0 +1,136 @@
+# search.py — index inversé du catalogue (nom, catégorie, coloris) pour /search et le mode inline
+# Recherche insensible à la casse et aux accents, par préfixe ("bask" -> "basket")
+# et tolérante aux fautes de frappe (une lettre d'écart, deux pour les mots longs).
+# L'index est mis à jour de façon incrémentale: seuls les produits dont le texte
+# a changé depuis le catalogue précédent sont réindexés.
+import re, bisect, threading, unicodedata
+
+from sheets import on_catalog_change
+
+_WORD = re.compile(r"\w+")
+
+EXACT, PREFIX, FUZZY = 3, 2, 1  # poids d'un terme selon la façon dont il a été trouvé
+
+def fold(text: str) -> str:
+    """Minuscules sans accents: "Été Doré" -> "ete dore"."""
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+
+def tokens(text: str) -> list[str]:
+    return _WORD.findall(fold(text))
+
+def _doc(p: dict) -> tuple:
+    return (p.get("name") or "", p.get("category") or "", tuple(p.get("colors") or ()))
+
+def _within(a: str, b: str, k: int) -> bool:
+    """Distance d'édition(a, b) <= k (Levenshtein borné)."""
+    if abs(len(a) - len(b)) > k:
+        return False
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j-1] + 1, prev[j-1] + (ca != cb))
+        if min(cur) > k:
+            return False
+        prev = cur
+    return prev[-1] <= k
+
+class SearchIndex:
+    def __init__(self):
+        self.version = None
+        self._lock = threading.Lock()
+        self._docs: dict[int, tuple] = {}          # pid -> texte indexé
+        self._terms: dict[int, set[str]] = {}      # pid -> jetons
+        self._postings: dict[str, set[int]] = {}   # jeton -> pids
+        self._vocab: list[str] = []                # jetons triés (recherche par préfixe)
+        self._order: dict[int, int] = {}           # pid -> rang dans le catalogue
+        self._expand: dict[str, dict[str, int]] = {}
+
+    def _remove(self, pid: int):
+        for t in self._terms.pop(pid, ()):
+            pids = self._postings.get(t)
+            if pids is not None:
+                pids.discard(pid)
+                if not pids:
+                    del self._postings[t]
+        self._docs.pop(pid, None)
+
+    def update(self, catalog):
+        """Aligne l'index sur `catalog`; renvoie le nombre de produits réindexés."""
+        with self._lock:
+            if catalog.version == self.version:
+                return 0
+            changed = 0
+            for pid in [pid for pid in self._docs if pid not in catalog.by_id]:
+                self._remove(pid)
+                changed += 1
+            for pid, p in catalog.by_id.items():
+                doc = _doc(p)
+                if self._docs.get(pid) == doc:
+                    continue
+                self._remove(pid)
+                terms = set(tokens(" ".join((doc[0], doc[1]) + doc[2])))
+                for t in terms:
+                    self._postings.setdefault(t, set()).add(pid)
+                self._docs[pid] = doc
+                self._terms[pid] = terms
+                changed += 1
+            if changed:
+                self._vocab = sorted(self._postings)
+                self._expand.clear()
+            self._order = {p["id"]: i for i, p in enumerate(catalog.products)}
+            self.version = catalog.version
+            return changed
+
+    def _expand_term(self, term: str) -> dict[str, int]:
+        """Jetons de l'index correspondant à `term`, avec leur poids."""
+        hit = self._expand.get(term)
+        if hit is not None:
+            return hit
+        found = {}
+        i = bisect.bisect_left(self._vocab, term)
+        while i < len(self._vocab) and self._vocab[i].startswith(term):
+            t = self._vocab[i]
+            found[t] = EXACT if t == term else PREFIX
+            i += 1
+        if len(term) >= 4:
+            k = 2 if len(term) >= 8 else 1
+            for t in self._vocab:
+                if t not in found and t[0] == term[0] and _within(term, t[:len(term) + k], k):
+                    found[t] = FUZZY
+        if len(self._expand) > 10_000:
+            self._expand.clear()
+        self._expand[term] = found
+        return found
+
+    def search(self, catalog, query: str, limit: int = 20, offset: int = 0) -> list[dict]:
+        """Produits contenant tous les termes de `query`, les plus pertinents d'abord."""
+        if catalog.version != self.version:
+            self.update(catalog)
+        terms = tokens(query)
+        if not terms:
+            return []
+        with self._lock:
+            scores: dict[int, int] | None = None
+            for term in terms:
+                best: dict[int, int] = {}
+                for t, w in self._expand_term(term).items():
+                    for pid in self._postings.get(t, ()):
+                        if w > best.get(pid, 0):
+                            best[pid] = w
+                if scores is None:
+                    scores = best
+                else:
+                    scores = {pid: s + best[pid] for pid, s in scores.items() if pid in best}
+                if not scores:
+                    return []
+            order = self._order
+            ranked = sorted(scores, key=lambda pid: (-scores[pid], order.get(pid, 0)))
+        return [p for p in (catalog.get(pid) for pid in ranked[offset: offset+limit]) if p]
+
+index = SearchIndex()
+
+@on_catalog_change
+def _reindex(catalog):
+    index.update(catalog)
@@ -0,0 +1,137 @@
+# sessions.py — expiration des états par utilisateur (paniers, checkout, saisies en attente)
+# Chaque SessionMap garde l'heure de dernière activité de ses entrées; un
+# balayeur de fond supprime celles qui ont dépassé leur TTL, et une capacité
+# max évince les plus anciennes. Sans ça, un utilisateur qui abandonne un
+# checkout ou une saisie de taille garde son entrée jusqu'au redémarrage.
+import os, time, asyncio
+from collections import OrderedDict
+
+from storage import StateMap
+
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+_registry: dict[str, "SessionMap"] = {}
+_task: asyncio.Task | None = None
+
+def _env_ttl(ns: str, default: float) -> float:
+    return float(os.getenv(f"SESSION_TTL_{ns.upper()}", default))
+
+def _env_max(ns: str, default: int) -> int:
+    return int(os.getenv(f"SESSION_MAX_{ns.upper()}", default))
+
+class SessionMap(StateMap):
+    """StateMap avec TTL et capacité bornée.
+
+    - ttl: durée de vie (s) depuis la dernière écriture, ou depuis la dernière
+      activité de l'utilisateur si `refresh_on_activity` (paniers).
+    - max_entries: au-delà, les entrées les moins récentes sont supprimées.
+    TTL et capacité sont surchargeables par SESSION_TTL_<NS> / SESSION_MAX_<NS>.
+    """
+
+    def __init__(self, ns: str, ttl: float, max_entries: int = 100_000, refresh_on_activity: bool = False,
+                 backend=None, codec=None):
+        super().__init__(ns, backend=backend, codec=codec)
+        self.ttl = _env_ttl(ns, ttl)
+        self.max_entries = _env_max(ns, max_entries)
+        self.refresh_on_activity = refresh_on_activity
+        self._last: OrderedDict[str, float] = OrderedDict()  # clé -> dernière activité
+        self._seeded = False
+        _registry[ns] = self
+
+    def _touch(self, key: str, now: float | None = None):
+        self._last[key] = now or time.time()
+        self._last.move_to_end(key)
+
+    def __setitem__(self, uid, value):
+        super().__setitem__(uid, value)
+        self._touch(str(uid))
+        while len(self._last) > self.max_entries:
+            oldest, _ = self._last.popitem(last=False)
+            self._store.delete(self.ns, oldest)
+
+    def __delitem__(self, uid):
+        super().__delitem__(uid)
+        self._last.pop(str(uid), None)
+
+    def mutate(self, uid, fn):
+        value = super().mutate(uid, fn)
+        if value is None:
+            self._last.pop(str(uid), None)
+        else:
+            self._touch(str(uid))
+        return value
+
+    def _written_at(self, key: str) -> float | None:
+        updated_at = getattr(self._store, "updated_at", None)
+        return updated_at(self.ns, key) if updated_at else None
+
+    def touch(self, uid):
+        key = str(uid)
+        if key in self._last:
+            self._touch(key)
+
+    def sweep(self, now: float | None = None) -> int:
+        now = now or time.time()
+        if not self._seeded:
+            # entrées persistées avant ce démarrage: leur TTL part de maintenant
+            for key in self._store.keys(self.ns):
+                self._last.setdefault(key, now)
+            self._seeded = True
+        removed = 0
+        deadline = now - self.ttl
+        while self._last:
+            key, ts = next(iter(self._last.items()))
+            if ts >= deadline:
+                break
+            self._last.popitem(last=False)
+            written = self._written_at(key)
+            if written is not None and written >= deadline:
+                self._touch(key, written)  # réécrite entre-temps (autre worker)
+                continue
+            self._store.delete(self.ns, key)
+            removed += 1
+        return removed
+
+    def live(self) -> int:
+        return len(self._last) if self._seeded else len(self)
+
+def touch_user(uid):
+    """Activité de l'utilisateur: prolonge les sessions marquées refresh_on_activity."""
+    for m in _registry.values():
+        if m.refresh_on_activity:
+            m.touch(uid)
+
+def sweep_all() -> dict[str, int]:
+    now = time.time()
+    removed = {ns: m.sweep(now) for ns, m in _registry.items()}
+    for m in _registry.values():
+        m._store.flush()
+    return removed
+
+def live_counts() -> dict[str, int]:
+    return {ns: m.live() for ns, m in _registry.items()}
+
+async def _sweeper():
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        try:
+            removed = sweep_all()
+            if any(removed.values()):
+                print(f"[SESSIONS] expirées: {removed}")
+        except Exception as e:
+            print(f"[SESSIONS SWEEP ERROR] {e}")
+
+def start():
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(_sweeper())
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
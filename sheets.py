@@ -1,9 +1,12 @@
 # sheets.py
-import os, time, json, re
-import gspread
-from google.oauth2.service_account import Credentials
+import os, time, json, re, asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, lru_cache
 from dotenv import load_dotenv
 
+from catalog import Catalog, Product, EMPTY as EMPTY_CATALOG
+from metrics import sheets_call, PRODUCTS_CACHE, Gauge
+
 # Charge .env
 load_dotenv()
 
@@ -15,8 +18,26 @@ _SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 
 _gc = None
 _sh = None
-_cache = {"products": ([], 0)}
-TTL = 5  # secondes (cache court pour voir vite les MAJ)
+_client_lock = threading.Lock()
+_cache = {"catalog": (EMPTY_CATALOG, 0)}  # (Catalog, horodatage du chargement)
+# stale-while-revalidate: avant SOFT_TTL on sert le cache tel quel, entre SOFT_TTL
+# et HARD_TTL on le sert aussi mais un rechargement part en tâche de fond,
+# au-delà de HARD_TTL l'appelant attend le rechargement.
+SOFT_TTL = float(os.getenv("PRODUCTS_SOFT_TTL", "5"))
+HARD_TTL = float(os.getenv("PRODUCTS_HARD_TTL", "600"))
+TTL = SOFT_TTL  # compat
+_refresh_lock = threading.Lock()
+_refresh = (None, 0.0)  # (Future du rechargement en cours, début)
+_reload_lock = threading.Lock()  # un rechargement forcé attend la fin de celui en cours (_sync, instantané)
+
+# gspread est bloquant : les appels réseau tournent dans un pool dédié et borné
+# pour ne jamais geler la boucle asyncio (les autres utilisateurs continuent).
+SHEETS_WORKERS = int(os.getenv("SHEETS_WORKERS", "4"))
+_executor = ThreadPoolExecutor(max_workers=SHEETS_WORKERS, thread_name_prefix="sheets")
+
+async def _run(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
 
 # --- Helpers Google Drive -----------------------------------------------------
 
@@ -45,6 +66,7 @@ def _extract_gdrive_id(value: str) -> str | None:
 
     return None
 
+@lru_cache(maxsize=8192)  # la même image revient sur plusieurs lignes/coloris
 def _to_direct_gdrive_url(value: str) -> str:
     fid = _extract_gdrive_id(value) if value else None
     if fid:
@@ -55,10 +77,20 @@ def _to_direct_gdrive_url(value: str) -> str:
 # -----------------------------------------------------------------------------
 
 def _ensure_client():
+    with _client_lock:
+        _ensure_client_locked()
+
+def _ensure_client_locked():
     global _gc, _sh
+    # import différé: gspread/google-auth ne pèsent sur le démarrage qu'au premier appel Sheets
+    import gspread
+    from google.oauth2.service_account import Credentials
     if _gc is None:
+        from requests.adapters import HTTPAdapter
         creds = Credentials.from_service_account_file("service_account.json", scopes=_SCOPES)
         _gc = gspread.authorize(creds)
+        # une seule session authentifiée (keep-alive), avec une connexion par thread du pool
+        _gc.http_client.session.mount("https://", HTTPAdapter(pool_maxsize=max(10, SHEETS_WORKERS)))
     if _sh is None:
         if not SHEET_ID:
             raise RuntimeError("SHEET_ID manquant (vérifie ton .env).")
@@ -71,97 +103,392 @@ def _ensure_client():
                 " - le PARTAGE avec l'email du service account (Éditeur)."
             ) from ex
 
-def _ws(name: str):
+def warm_up():
+    """Authentification + ouverture du classeur et de l'onglet des commandes (au démarrage, avant tout client)."""
     _ensure_client()
-    return _sh.worksheet(name)
+    _ws(ORDERS_TAB)
+
+_worksheets: dict = {}  # titre -> Worksheet (évite un appel de métadonnées par lecture/écriture)
+
+def _ws(name: str):
+    ws = _worksheets.get(name)
+    if ws is None:
+        _ensure_client()
+        with sheets_call("worksheet"):
+            ws = _worksheets[name] = _sh.worksheet(name)
+    return ws
 
 def _norm_key(k: str) -> str:
     # normalise les clés d'en-tête: "Image Color Map JSON " => "image_color_map_json"
     return re.sub(r"\s+", "_", (k or "").strip().lower())
 
-def _normalize_row_keys(r: dict) -> dict:
-    return {_norm_key(k): v for k, v in r.items()}
+_TRUE = frozenset(("1", "true", "vrai", "yes", "oui"))
 
-def _parse_colors(val: str):
+# parsers mémoïsés: une même liste de coloris ou un même JSON d'images est partagé entre lignes
+@lru_cache(maxsize=4096)
+def _parse_colors(val: str) -> tuple[str, ...]:
     if not val:
-        return []
-    return [c.strip() for c in str(val).split(",") if c.strip()]
+        return ()
+    return tuple(c.strip() for c in str(val).split(",") if c.strip())
 
-def _parse_image_color_map_json(val: str):
+@lru_cache(maxsize=4096)
+def _parse_image_color_map_json(val: str) -> dict:
     if not val:
         return {}
     try:
         data = json.loads(val)
-        out = {}
-        for k, v in data.items():
-            out[str(k).strip()] = _to_direct_gdrive_url(str(v).strip())
-        return out
+        return {str(k).strip(): _to_direct_gdrive_url(str(v).strip()) for k, v in data.items()}
     except Exception:
         return {}
 
-def get_products(force: bool = False):
-    now = time.time()
-    if not force and (now - _cache["products"][1] < TTL):
-        return _cache["products"][0]
-
-    rows = _ws(PRODUCTS_TAB).get_all_records()  # liste de dicts
-    products = []
-    for raw in rows:
-        r = _normalize_row_keys(raw)  # <--- normalisation des en-têtes
-        if str(r.get("active", 1)).strip().lower() not in ("1", "true", "vrai", "yes", "oui"):
+def _to_int(v):
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+def _padded(cols: dict, field: str, n: int, default: str = "") -> list:
+    c = cols.get(field)
+    if c is None:
+        return [default] * n
+    return c + [""] * (n - len(c)) if len(c) < n else c[:n]
+
+def _parse_columns(cols: dict[str, list], n: int, first: int = 0):
+    """Colonnes brutes {champ: [valeurs]} -> ([Product | None] par ligne, {ligne: motif de rejet}).
+
+    Conversions faites colonne par colonne; None pour une ligne inactive ou rejetée.
+    `first` = index (0 = première ligne de données) de la première valeur, pour les motifs.
+    """
+    active = [str(v).strip().lower() in _TRUE for v in _padded(cols, "active", n, "1")]
+    raw_ids = _padded(cols, "id", n)
+    ids = [_to_int(v) for v in raw_ids]
+    raw_prices = _padded(cols, "price_cents", n, "0")
+    prices = [_to_int(v) for v in raw_prices]
+    raw_stocks = _padded(cols, "stock", n, "0")
+    stocks = [_to_int(v) for v in raw_stocks]
+    names = _padded(cols, "name", n)
+    sizes = _padded(cols, "sizes", n)
+    categories = _padded(cols, "category", n)
+    images = _padded(cols, "image_url", n)
+    colors = _padded(cols, "colors", n)
+    cmaps = _padded(cols, "image_color_map_json", n)
+
+    rows: list = [None] * n
+    rejected: dict[int, str] = {}
+    for k in range(n):
+        if not active[k]:
             continue
+        if ids[k] is None:
+            if raw_ids[k] == "" and not names[k]:
+                continue  # ligne vide
+            rejected[first + k] = f"id invalide: {raw_ids[k]!r}"
+        elif prices[k] is None:
+            rejected[first + k] = f"price_cents invalide: {raw_prices[k]!r}"
+        elif stocks[k] is None:
+            rejected[first + k] = f"stock invalide: {raw_stocks[k]!r}"
+        else:
+            rows[k] = Product(
+                ids[k], str(names[k]).strip(), prices[k], str(sizes[k]).strip(), str(categories[k]).strip(),
+                _to_direct_gdrive_url(str(images[k]).strip()), stocks[k],
+                _parse_colors(str(colors[k])), _parse_image_color_map_json(str(cmaps[k])),
+            )
+    return rows, rejected
+
+# --- Synchro de l'onglet Products ---------------------------------------------
+# "full"  : on relit toute la feuille à chaque rechargement.
+# "delta" : si l'onglet a une colonne `updated_at` (date de modif, formule ou
+#           Apps Script), on lit d'abord l'en-tête + les colonnes id/updated_at
+#           (une seule requête étroite) et on ne télécharge que les lignes dont
+#           le couple (id, updated_at) a changé. Une resynchro complète reste
+#           faite toutes les PRODUCTS_FULL_SYNC secondes par sécurité.
+
+PRODUCTS_SYNC = os.getenv("PRODUCTS_SYNC", "delta").strip().lower()
+PRODUCTS_FULL_SYNC = float(os.getenv("PRODUCTS_FULL_SYNC", "3600"))
+_DELTA_MAX_RATIO = 0.5  # au-delà de 50% de lignes modifiées, une relecture complète coûte moins
+# batchGet passe toutes les plages dans l'URL (GET): on fusionne les lignes voisines
+# et, au-delà de DELTA_MAX_RANGES plages, on relit tout en une requête
+DELTA_MAX_RANGES = int(os.getenv("PRODUCTS_DELTA_MAX_RANGES", "50"))
+_DELTA_GAP = 8  # lignes inchangées relues pour éviter d'ouvrir une nouvelle plage
+
+_sync = {
+    "header": None,   # en-têtes normalisés
+    "signals": [],    # (id, updated_at) brut par ligne de données
+    "rows": [],       # Product (ou None) par ligne de données, dans l'ordre de la feuille
+    "rejected": {},   # index de ligne de données -> motif du rejet
+    "full_at": 0.0,
+}
+
+# colonnes réellement utilisées: les autres (notes, fournisseur...) ne sont jamais téléchargées
+_FIELDS = ("id", "name", "price_cents", "sizes", "category", "image_url", "stock",
+           "colors", "image_color_map_json", "active", "updated_at")
+
+def _col(n: int) -> str:
+    """Lettre de colonne A1 (1 -> A, 27 -> AA)."""
+    letters = ""
+    while n:
+        n, r = divmod(n - 1, 26)
+        letters = chr(65 + r) + letters
+    return letters
+
+def _a1(rng: str, tab: str = PRODUCTS_TAB) -> str:
+    return "'" + tab.replace("'", "''") + "'!" + rng
+
+def _batch_get(ranges: list[str], columns: bool = False, tab: str = PRODUCTS_TAB) -> list[list]:
+    """Plusieurs plages d'un onglet (Products par défaut) en une seule requête values:batchGet (sans métadonnées)."""
+    _ensure_client()
+    params = {"majorDimension": "COLUMNS"} if columns else None
+    res = _sh.values_batch_get([_a1(r, tab) for r in ranges], params=params)
+    return [vr.get("values", []) for vr in res.get("valueRanges", [])]
+
+def _header_of(cells: list) -> list[str]:
+    # ligne 1 lue en COLUMNS: une liste par colonne ([] si cellule vide)
+    return [_norm_key(c[0] if c else "") for c in cells]
+
+def _cell(col: list, k: int) -> str:
+    return col[k] if k < len(col) else ""
+
+@lru_cache(maxsize=16)
+def _layout(header: tuple[str, ...]):
+    """Mise en page compilée une fois par en-tête: champs lus, leur colonne, et l'intervalle couvert."""
+    fields = tuple(f for f in _FIELDS if f in header)
+    pos = {f: header.index(f) for f in fields}
+    lo, hi = (min(pos.values()), max(pos.values())) if pos else (0, 0)
+    return fields, pos, lo, hi
+
+def _full_sync(header: list[str] | None = None):
+    if not header:
+        # mise en page inconnue (premier chargement): on lit l'onglet entier une fois
+        values = _batch_get(["A1:ZZ"])[0]
+        header = [_norm_key(h) for h in values[0]] if values else []
+        fields, pos, _, _ = _layout(tuple(header))
+        cols = {f: [_cell(v, pos[f]) for v in values[1:]] for f in fields}
+    else:
+        fields, pos, _, _ = _layout(tuple(header))
+        got = _batch_get(["1:1"] + [f"{_col(pos[f] + 1)}2:{_col(pos[f] + 1)}" for f in fields], columns=True)
+        if _header_of(got[0]) != header:
+            return _full_sync(None)  # colonnes déplacées/renommées
+        cols = {f: (c[0] if c else []) for f, c in zip(fields, got[1:])}
+    n = max((len(c) for c in cols.values()), default=0)
+    rows, rejected = _parse_columns(cols, n)
+    signals = []
+    if "id" in cols and "updated_at" in cols:
+        c_id, c_upd = cols["id"], cols["updated_at"]
+        signals = [(_cell(c_id, k), _cell(c_upd, k)) for k in range(n)]
+    unchanged = header == _sync["header"] and rows == _sync["rows"] and rejected == _sync["rejected"]
+    _sync.update(header=header, signals=signals, rows=rows, rejected=rejected, full_at=time.time())
+    if unchanged:
+        return None  # même catalogue: ni nouvelle version, ni instantané, ni listeners
+    return [p for p in rows if p]
+
+def _runs(rows: list[int], gap: int = _DELTA_GAP) -> list[tuple[int, int]]:
+    """Indices triés -> plages (début, fin) inclusives: [3, 4, 5, 9, 40] -> [(3, 9), (40, 40)]."""
+    runs = []
+    for k in rows:
+        if runs and k - runs[-1][1] <= gap + 1:
+            runs[-1] = (runs[-1][0], k)
+        else:
+            runs.append((k, k))
+    return runs
+
+def _delta_sync():
+    """Retourne la nouvelle liste de produits, ou None si rien n'a changé."""
+    header = _sync["header"]
+    fields, pos, lo, hi = _layout(tuple(header))
+    col_id, col_upd = _col(pos["id"] + 1), _col(pos["updated_at"] + 1)
+    head, ids, stamps = _batch_get(["1:1", f"{col_id}2:{col_id}", f"{col_upd}2:{col_upd}"], columns=True)
+    if _header_of(head) != header:
+        return _full_sync(None)  # colonnes déplacées/renommées
+    ids, stamps = (ids[0] if ids else []), (stamps[0] if stamps else [])
+
+    n = max(len(ids), len(stamps))
+    signals = [(_cell(ids, k), _cell(stamps, k)) for k in range(n)]
+    old = _sync["signals"]
+    changed = [k for k in range(n) if k >= len(old) or old[k] != signals[k]]
+    if not changed and n == len(old):
+        return None
+    runs = _runs(changed)
+    if len(changed) > _DELTA_MAX_RATIO * max(n, 1) or len(runs) > DELTA_MAX_RANGES:
+        return _full_sync(header)
+
+    rows = _sync["rows"][:n]
+    rows += [None] * (n - len(rows))
+    rejected = {k: r for k, r in _sync["rejected"].items() if k < n}
+    if runs:
+        # blocs de lignes modifiées, restreints à l'intervalle des colonnes utilisées
+        fetched = _batch_get([f"{_col(lo + 1)}{a + 2}:{_col(hi + 1)}{b + 2}" for a, b in runs])
+        for (a, b), vr in zip(runs, fetched):
+            lines = [_cell(vr, i) or [] for i in range(b - a + 1)]  # lignes vides finales absentes de la réponse
+            cols = {f: [_cell(line, pos[f] - lo) for line in lines] for f in fields}
+            block, bad = _parse_columns(cols, b - a + 1, first=a)
+            rows[a:b + 1] = block
+            for k in range(a, b + 1):
+                rejected.pop(k, None)
+            rejected.update(bad)
+    _sync.update(signals=signals, rows=rows, rejected=rejected)
+    return [p for p in rows if p]
+
+def rejected_rows() -> list[tuple[int, str]]:
+    """Lignes de l'onglet Products ignorées au dernier chargement: [(n° de ligne dans la feuille, motif)]."""
+    return sorted((k + 2, reason) for k, reason in _sync["rejected"].items())
+
+Gauge("catalog_rejected_rows", "Lignes de l'onglet Products rejetées au dernier chargement",
+      fn=lambda: len(_sync["rejected"]))
+
+def _fetch_products():
+    header = _sync["header"]
+    if (PRODUCTS_SYNC != "delta" or not header or "updated_at" not in header or "id" not in header
+            or time.time() - _sync["full_at"] >= PRODUCTS_FULL_SYNC):
+        with sheets_call("products_full"):
+            return _full_sync(header)
+    with sheets_call("products_delta"):
+        return _delta_sync()
+
+# --- Instantané disque ---------------------------------------------------------
+# Le dernier catalogue lu est sauvegardé localement: au démarrage (cold start
+# Render) on sert immédiatement cet instantané et Sheets est relu en tâche de
+# fond. Si Google est lent/indisponible, navigation et panier continuent dessus.
+
+SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT", "catalog_snapshot.json")
+SHEETS_RETRY = float(os.getenv("SHEETS_RETRY", "30"))  # délai avant de retenter après un échec
+
+def _save_snapshot():
+    if not SNAPSHOT_PATH:
+        return
+    data = {"saved_at": time.time(), **_sync,
+            "rows": [p.to_dict() if p else None for p in _sync["rows"]]}
+    tmp = SNAPSHOT_PATH + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, SNAPSHOT_PATH)
+    except OSError as e:
+        print(f"[SNAPSHOT ERROR] {e}")
+
+def load_snapshot() -> bool:
+    """Charge l'instantané disque dans le cache (considéré comme à revalider)."""
+    if not SNAPSHOT_PATH or not os.path.exists(SNAPSHOT_PATH):
+        return False
+    try:
+        with open(SNAPSHOT_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+        rows = [Product.from_dict(p) if p else None for p in data["rows"]]
+        _sync.update(
+            header=data["header"],
+            signals=[tuple(x) for x in data["signals"]],
+            rows=rows,
+            rejected={int(k): v for k, v in data.get("rejected", {}).items()},
+            full_at=data["full_at"],
+        )
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"[SNAPSHOT ERROR] instantané ignoré: {e}")
+        return False
+    if _cache["catalog"][1]:
+        return False  # Sheets a déjà répondu entre-temps
+    # âge = SOFT_TTL: servi tout de suite, le premier accès relance Sheets
+    _cache["catalog"] = (Catalog([p for p in rows if p]), time.time() - SOFT_TTL)
+    return True
+
+_catalog_listeners = []
+_notified_version = None  # dernier catalogue transmis aux listeners
+
+def on_catalog_change(fn):
+    """Enregistre fn(catalog), appelé (hors boucle asyncio) à chaque nouveau catalogue."""
+    _catalog_listeners.append(fn)
+    return fn
+
+def _notify_catalog_change(catalog: Catalog):
+    global _notified_version
+    _notified_version = catalog.version
+    for fn in _catalog_listeners:
         try:
-            base_image = _to_direct_gdrive_url(str(r.get("image_url", "")).strip())
-            products.append({
-                "id": int(r.get("id")),
-                "name": str(r.get("name", "")).strip(),
-                "price_cents": int(r.get("price_cents", 0)),
-                "sizes": str(r.get("sizes", "")).strip(),  # gardé pour affichage
-                "category": str(r.get("category", "")).strip(),
-                "image": base_image,
-                "stock": int(r.get("stock", 0)),
-                "colors": _parse_colors(r.get("colors", "")),
-                "image_color_map": _parse_image_color_map_json(r.get("image_color_map_json", "")),
-            })
-        except Exception:
-            continue
+            fn(catalog)
+        except Exception as e:
+            print(f"[CATALOG LISTENER ERROR] {fn.__name__}: {e}")
+
+def _report_rejected(before: dict):
+    if _sync["rejected"] == before or not _sync["rejected"]:
+        return
+    rows = rejected_rows()
+    detail = "; ".join(f"ligne {line}: {reason}" for line, reason in rows[:10])
+    more = f" (+{len(rows) - 10})" if len(rows) > 10 else ""
+    print(f"[CATALOG] {len(rows)} ligne(s) ignorée(s) dans {PRODUCTS_TAB}: {detail}{more}")
+
+def _reload_products():
+    with _reload_lock:
+        before = _sync["rejected"]
+        products = _fetch_products()
+        catalog = _cache["catalog"][0] if products is None else Catalog(products)
+        _cache["catalog"] = (catalog, time.time())
+        if products is not None:
+            _report_rejected(before)
+            _save_snapshot()
+            _notify_catalog_change(catalog)
+        elif catalog.version != _notified_version:
+            _notify_catalog_change(catalog)  # instantané disque confirmé tel quel par Sheets
+        return catalog
+
+def _log_refresh_error(fut):
+    if not fut.cancelled() and fut.exception() is not None:
+        print(f"[SHEETS REFRESH ERROR] {fut.exception()}")
+        catalog, ts = _cache["catalog"]
+        if ts:
+            # on garde l'ancien catalogue servi sans attente, nouvel essai dans SHEETS_RETRY s
+            _cache["catalog"] = (catalog, time.time() - SOFT_TTL + SHEETS_RETRY)
+
+def _start_refresh(fresh_after: float | None = None):
+    """Lance (ou rejoint) l'unique rechargement en cours."""
+    global _refresh
+    with _refresh_lock:
+        fut, started = _refresh
+        if fut is None or fut.done() or (fresh_after is not None and started < fresh_after):
+            started = time.time()
+            fut = _executor.submit(_reload_products)
+            fut.add_done_callback(_log_refresh_error)
+            _refresh = (fut, started)
+        return fut
+
+def _fallback(ex: Exception):
+    catalog, ts = _cache["catalog"]
+    if not ts:
+        raise ex
+    print(f"[SHEETS] rechargement impossible, catalogue précédent servi: {ex}")
+    return catalog
 
-    _cache["products"] = (products, now)
-    return products
+def get_catalog(force: bool = False) -> Catalog:
+    catalog, ts = _cache["catalog"]
+    age = time.time() - ts
+    if not force and ts and age < HARD_TTL:
+        if age >= SOFT_TTL:
+            PRODUCTS_CACHE.inc("stale")
+            _start_refresh()  # en tâche de fond, on sert l'ancien instantané
+        else:
+            PRODUCTS_CACHE.inc("hit")
+        return catalog
+    PRODUCTS_CACHE.inc("miss")
+    fut = _start_refresh(time.time() if force else None)
+    try:
+        return fut.result()
+    except Exception as ex:
+        return _fallback(ex)
+
+def get_products(force: bool = False):
+    return get_catalog(force).products
 
 def list_categories():
-    return sorted({p["category"] for p in get_products() if p["category"]})
+    return get_catalog().categories
 
 def list_products(category=None, offset=0, limit=6):
-    prods = get_products()
-    if category:
-        prods = [p for p in prods if p["category"] == category]
-    total = len(prods)
-    return prods[offset: offset+limit], total
+    return get_catalog().page(category, offset, limit)
 
 def get_product(pid: int):
-    for p in get_products():
-        if p["id"] == pid:
-            return p
-    return None
+    return get_catalog().get(pid)
 
 def get_image_for(product: dict, color: str | None = None):
     """Essaye clé exacte, puis match insensible casse/espaces."""
-    if color:
-        img_map = product.get("image_color_map") or {}
-        # exact
-        if color in img_map and img_map[color]:
-            return img_map[color]
-        # insensible à la casse/espaces
-        norm = color.lower().strip()
-        for k, v in img_map.items():
-            if k.lower().strip() == norm and v:
-                return v
-    return product.get("image") or ""
+    return _cache["catalog"][0].image_for(product, color)
 
-def append_order(order_dict: dict):
-    ws = _ws(ORDERS_TAB)
-    row = [
+def _order_row(order_dict: dict) -> list:
+    return [
         order_dict.get("order_id", ""),
         order_dict.get("timestamp", ""),
         order_dict.get("user_id", ""),
@@ -172,4 +499,85 @@ def append_order(order_dict: dict):
         order_dict.get("total_cents", 0),
         order_dict.get("status", "new"),
     ]
-    ws.append_row(row, value_input_option="USER_ENTERED")
+
+def append_order(order_dict: dict):
+    ws = _ws(ORDERS_TAB)
+    try:
+        with sheets_call("orders_append"):
+            ws.append_row(_order_row(order_dict), value_input_option="USER_ENTERED")
+    except Exception:
+        _worksheets.pop(ORDERS_TAB, None)  # onglet renommé/recréé: on le relira
+        raise
+
+def append_orders(orders: list[dict]):
+    """Écrit plusieurs commandes en un seul appel API."""
+    if not orders:
+        return
+    ws = _ws(ORDERS_TAB)
+    try:
+        with sheets_call("orders_append"):
+            ws.append_rows([_order_row(o) for o in orders], value_input_option="USER_ENTERED")
+    except Exception:
+        _worksheets.pop(ORDERS_TAB, None)  # onglet renommé/recréé: on le relira
+        raise
+
+def written_order_ids() -> set[str]:
+    """order_id déjà présents dans l'onglet Orders (colonne A), pour ne pas réécrire un lot incertain."""
+    with sheets_call("orders_ids"):
+        cols = _batch_get(["A2:A"], columns=True, tab=ORDERS_TAB)[0]
+    return {str(v).strip() for v in (cols[0] if cols else [])}
+
+def fetch_orders() -> list[dict]:
+    """Toutes les lignes de l'onglet Orders ({en-tête normalisé: valeur}), en une lecture."""
+    with sheets_call("orders_read"):
+        values = _batch_get(["A1:ZZ"], tab=ORDERS_TAB)[0]
+    if not values:
+        return []
+    header = [_norm_key(h) for h in values[0]]
+    return [dict(zip(header, row)) for row in values[1:] if any(row)]
+
+# --- Variantes async (à utiliser depuis les handlers aiogram) -----------------
+
+async def get_catalog_async(force: bool = False) -> Catalog:
+    catalog, ts = _cache["catalog"]
+    age = time.time() - ts
+    if not force and ts and age < HARD_TTL:
+        if age >= SOFT_TTL:
+            PRODUCTS_CACHE.inc("stale")
+            _start_refresh()
+        else:
+            PRODUCTS_CACHE.inc("hit")
+        return catalog  # simple lecture de dict, sans passer par le pool
+    PRODUCTS_CACHE.inc("miss")
+    fut = _start_refresh(time.time() if force else None)
+    try:
+        # shield: un handler annulé ne doit pas annuler le rechargement partagé
+        return await asyncio.shield(asyncio.wrap_future(fut))
+    except Exception as ex:
+        return _fallback(ex)
+
+async def get_products_async(force: bool = False):
+    return (await get_catalog_async(force)).products
+
+async def list_categories_async():
+    return (await get_catalog_async()).categories
+
+async def list_products_async(category=None, offset=0, limit=6):
+    return (await get_catalog_async()).page(category, offset, limit)
+
+async def get_product_async(pid: int):
+    return (await get_catalog_async()).get(pid)
+
+async def append_order_async(order_dict: dict):
+    await _run(append_order, order_dict)
+
+async def append_orders_async(orders: list[dict]):
+    await _run(append_orders, orders)
+
+async def written_order_ids_async() -> set[str]:
+    return await _run(written_order_ids)
+
+async def fetch_orders_async() -> list[dict]:
+    return await _run(fetch_orders)
+
+load_snapshot()
@@ -0,0 +1,292 @@
+# storage.py — état utilisateur persistant (paniers, checkout, saisies en attente, FSM)
+# Deux backends interchangeables:
+#   - "memory" : dicts en mémoire (comportement historique, un seul process)
+#   - "sqlite" : fichier SQLite en mode WAL, partageable entre plusieurs workers
+#                uvicorn et conservé entre deux déploiements.
+# Côté SQLite, les écritures sont regroupées (flush en fin d'update ou par lot)
+# et les lectures passent par un cache en process de courte durée.
+import os, json, time, sqlite3, threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").strip().lower()
+STATE_DB = os.getenv("STATE_DB", "state.db")
+STATE_CACHE_TTL = float(os.getenv("STATE_CACHE_TTL", "1"))   # fraîcheur max d'une lecture en cache (s)
+STATE_BATCH_SIZE = int(os.getenv("STATE_BATCH_SIZE", "100"))  # flush anticipé au-delà
+STATE_CACHE_MAX = int(os.getenv("STATE_CACHE_MAX", "10000"))  # entrées gardées dans le cache de lecture (LRU)
+
+_DELETED = object()
+
+class MemoryStore:
+    """Espaces de noms -> {clé: valeur} en mémoire."""
+
+    serializes = False  # les objets Python sont stockés tels quels
+
+    def __init__(self):
+        self._data: dict[str, dict] = {}
+
+    def get(self, ns: str, key: str, default=None, fresh: bool = False):
+        return self._data.get(ns, {}).get(key, default)
+
+    def set(self, ns: str, key: str, value):
+        self._data.setdefault(ns, {})[key] = value
+
+    def delete(self, ns: str, key: str):
+        self._data.get(ns, {}).pop(key, None)
+
+    def update(self, ns: str, key: str, fn):
+        """fn(valeur actuelle ou None) -> nouvelle valeur (None supprime); renvoie la nouvelle valeur."""
+        value = fn(self.get(ns, key))
+        if value is None:
+            self.delete(ns, key)
+        else:
+            self.set(ns, key, value)
+        return value
+
+    def keys(self, ns: str) -> list[str]:
+        return list(self._data.get(ns, {}))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class SQLiteStore:
+    """Table kv(ns, key, value JSON) en WAL, écritures groupées + cache de lecture."""
+
+    serializes = True  # valeurs stockées en JSON
+
+    def __init__(self, path: str, cache_ttl: float = STATE_CACHE_TTL, batch_size: int = STATE_BATCH_SIZE,
+                 cache_max: int = STATE_CACHE_MAX):
+        self.path = path
+        self.cache_ttl = cache_ttl
+        self.batch_size = batch_size
+        self.cache_max = cache_max
+        self._lock = threading.RLock()
+        self._cache: OrderedDict[tuple[str, str], tuple[object, float]] = OrderedDict()
+        self._pending: dict[tuple[str, str], object] = {}
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (ns, key))"
+        )
+
+    def get(self, ns: str, key: str, default=None, fresh: bool = False):
+        """fresh=True ignore le cache de lecture (valeur qu'un autre worker a pu changer à l'instant)."""
+        k = (ns, key)
+        with self._lock:
+            if k in self._pending:
+                v = self._pending[k]
+                return default if v is _DELETED else v
+            hit = None if fresh else self._cache.get(k)
+            if hit is not None and time.monotonic() - hit[1] < self.cache_ttl:
+                self._cache.move_to_end(k)
+                v = hit[0]
+                return default if v is _DELETED else v
+            row = self._db.execute("SELECT value FROM kv WHERE ns=? AND key=?", k).fetchone()
+            v = json.loads(row[0]) if row else _DELETED
+            self._cache[k] = (v, time.monotonic())
+            self._cache.move_to_end(k)
+            if len(self._cache) > self.cache_max:
+                self._cache.popitem(last=False)
+            return default if v is _DELETED else v
+
+    def set(self, ns: str, key: str, value):
+        # la valeur en attente fait foi jusqu'au flush; le cache ne sert qu'aux lectures SQLite
+        with self._lock:
+            self._pending[(ns, key)] = value
+            self._cache.pop((ns, key), None)
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def delete(self, ns: str, key: str):
+        self.set(ns, key, _DELETED)
+
+    def update(self, ns: str, key: str, fn):
+        """Lecture-modification-écriture atomique entre workers (transaction IMMEDIATE).
+
+        fn(valeur actuelle ou None) -> nouvelle valeur (None supprime). La lecture
+        ignore le cache, l'écriture est faite tout de suite (pas de lot).
+        """
+        k = (ns, key)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if k in self._pending:
+                    cur = self._pending[k]  # écriture locale plus récente, pas encore flushée
+                else:
+                    row = self._db.execute("SELECT value FROM kv WHERE ns=? AND key=?", k).fetchone()
+                    cur = json.loads(row[0]) if row else _DELETED
+                value = fn(None if cur is _DELETED else cur)
+                if value is None:
+                    self._db.execute("DELETE FROM kv WHERE ns=? AND key=?", k)
+                else:
+                    self._db.execute(
+                        "INSERT INTO kv(ns, key, value, updated_at) VALUES (?,?,?,?) "
+                        "ON CONFLICT(ns, key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at",
+                        (ns, key, json.dumps(value, ensure_ascii=False, separators=(",", ":")), time.time()),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._pending.pop(k, None)
+            self._cache.pop(k, None)
+            return value
+
+    def keys(self, ns: str) -> list[str]:
+        with self._lock:
+            keys = {r[0] for r in self._db.execute("SELECT key FROM kv WHERE ns=?", (ns,))}
+            for (pns, key), v in self._pending.items():
+                if pns == ns:
+                    if v is _DELETED:
+                        keys.discard(key)
+                    else:
+                        keys.add(key)
+            return list(keys)
+
+    def updated_at(self, ns: str, key: str) -> float | None:
+        """Date de dernière écriture (tous workers confondus), None si absente."""
+        with self._lock:
+            if (ns, key) in self._pending:
+                return time.time()
+            row = self._db.execute("SELECT updated_at FROM kv WHERE ns=? AND key=?", (ns, key)).fetchone()
+            return row[0] if row else None
+
+    def flush(self):
+        """Écrit les modifications en attente en une seule transaction."""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            for k in pending:
+                self._cache.pop(k, None)
+            now = time.time()
+            upserts = [(ns, key, json.dumps(v, ensure_ascii=False, separators=(",", ":")), now)
+                       for (ns, key), v in pending.items() if v is not _DELETED]
+            deletes = [k for k, v in pending.items() if v is _DELETED]
+            try:
+                self._db.execute("BEGIN")
+                if upserts:
+                    self._db.executemany(
+                        "INSERT INTO kv(ns, key, value, updated_at) VALUES (?,?,?,?) "
+                        "ON CONFLICT(ns, key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at",
+                        upserts,
+                    )
+                if deletes:
+                    self._db.executemany("DELETE FROM kv WHERE ns=? AND key=?", deletes)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                # on remet les écritures non appliquées (sans écraser les plus récentes)
+                for k, v in pending.items():
+                    self._pending.setdefault(k, v)
+                raise
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+def make_store():
+    if STATE_BACKEND == "sqlite":
+        return SQLiteStore(STATE_DB)
+    if STATE_BACKEND != "memory":
+        print(f"[WARN] STATE_BACKEND inconnu: {STATE_BACKEND!r}, utilisation de la mémoire.")
+    return MemoryStore()
+
+store = make_store()
+
+class StateMap(MutableMapping):
+    """Vue dict {uid: valeur} sur un espace de noms du store.
+
+    Les valeurs lues sont des instantanés: après modification d'un dict/liste,
+    il faut le réaffecter (`m[uid] = v`) pour qu'il soit persisté.
+    `codec=(dump, load)` convertit des objets métier vers/depuis du JSON pour les
+    backends qui sérialisent (en mémoire, l'objet est gardé tel quel).
+    """
+
+    def __init__(self, ns: str, backend=None, codec=None):
+        self.ns = ns
+        self._store = backend or store
+        self._codec = codec if (codec and self._store.serializes) else None
+
+    def __getitem__(self, uid):
+        v = self._store.get(self.ns, str(uid), _DELETED)
+        if v is _DELETED:
+            raise KeyError(uid)
+        return self._codec[1](v) if self._codec else v
+
+    def __setitem__(self, uid, value):
+        self._store.set(self.ns, str(uid), self._codec[0](value) if self._codec else value)
+
+    def __delitem__(self, uid):
+        if self._store.get(self.ns, str(uid), _DELETED) is _DELETED:
+            raise KeyError(uid)
+        self._store.delete(self.ns, str(uid))
+
+    def mutate(self, uid, fn):
+        """Modifie la valeur de `uid` de façon atomique: fn(valeur ou None) -> nouvelle valeur (None supprime)."""
+        dump, load = self._codec or (None, None)
+
+        def apply(raw):
+            value = fn(load(raw) if load and raw is not None else raw)
+            return dump(value) if dump and value is not None else value
+
+        value = self._store.update(self.ns, str(uid), apply)
+        return load(value) if load and value is not None else value
+
+    def fresh(self, uid, default=None):
+        """Comme get(), sans le cache de lecture du backend."""
+        v = self._store.get(self.ns, str(uid), _DELETED, fresh=True)
+        if v is _DELETED:
+            return default
+        return self._codec[1](v) if self._codec else v
+
+    def __contains__(self, uid):
+        return self._store.get(self.ns, str(uid), _DELETED) is not _DELETED
+
+    def __iter__(self):
+        return (int(k) if k.lstrip("-").isdigit() else k for k in self._store.keys(self.ns))
+
+    def __len__(self):
+        return len(self._store.keys(self.ns))
+
+# --- FSM aiogram -----------------------------------------------------------------
+
+def _fsm_key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or 0}:{key.destiny}"
+
+class StoreFSMStorage(BaseStorage):
+    """Stockage FSM aiogram adossé au même store (donc persistant avec le backend sqlite)."""
+
+    def __init__(self, backend=None):
+        self._store = backend or store
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        state = state.state if hasattr(state, "state") else state
+        if state is None:
+            self._store.delete("fsm_state", _fsm_key(key))
+        else:
+            self._store.set("fsm_state", _fsm_key(key), state)
+
+    async def get_state(self, key: StorageKey):
+        return self._store.get("fsm_state", _fsm_key(key))
+
+    async def set_data(self, key: StorageKey, data: dict) -> None:
+        if data:
+            self._store.set("fsm_data", _fsm_key(key), dict(data))
+        else:
+            self._store.delete("fsm_data", _fsm_key(key))
+
+    async def get_data(self, key: StorageKey) -> dict:
+        return dict(self._store.get("fsm_data", _fsm_key(key)) or {})
+
+    async def close(self) -> None:
+        self._store.flush()
@@ -0,0 +1,174 @@
+# throttle.py — limitation du débit entrant par utilisateur
+# Un utilisateur qui mitraille "Changer d’article" ou un coloris déclenche à
+# chaque tap un edit_media + edit_reply_markup: on borne son débit avec des
+# seaux à jetons (par utilisateur et par type de callback), et pour la
+# navigation seul le dernier tap d'une rafale est rendu. Les callbacks ignorés
+# reçoivent juste un answer() (sinon Telegram laisse le sablier affiché).
+import os, time, asyncio
+
+from aiogram import BaseMiddleware
+
+import metrics
+from storage import store as state_store
+
+THROTTLE = os.getenv("THROTTLE", "on").strip().lower() not in ("0", "off", "false", "no")
+USER_RATE = float(os.getenv("THROTTLE_USER_RATE", "6"))     # updates/s par utilisateur
+USER_BURST = float(os.getenv("THROTTLE_USER_BURST", "12"))
+KIND_RATE = float(os.getenv("THROTTLE_KIND_RATE", "3"))     # callbacks/s par utilisateur et par type
+KIND_BURST = float(os.getenv("THROTTLE_KIND_BURST", "5"))
+MAX_BUCKETS = 50_000
+
+# navigation: un tap plus récent du même type rend les précédents inutiles
+COALESCE = {"cat", "color", "colors", "confirm_color"}
+
+THROTTLED = metrics.Counter("bot_throttled_updates_total", "Updates ignorées par le limiteur entrant",
+                            ("kind", "reason"))
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self, now: float | None = None) -> bool:
+        self._refill(now or time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self, now: float | None = None) -> float:
+        """Attente (s) avant qu'un jeton soit disponible."""
+        self._refill(now or time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def idle(self, now: float) -> bool:
+        return self.tokens + (now - self.stamp) * self.rate >= self.burst
+
+class BucketMap:
+    """{clé: TokenBucket} créés à la demande; les seaux pleins sont oubliés quand il y en a trop."""
+
+    def __init__(self, rate: float, burst: float, max_size: int = MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self.max_size = max_size
+        self._buckets: dict = {}
+
+    def get(self, key) -> TokenBucket:
+        b = self._buckets.get(key)
+        if b is None:
+            if len(self._buckets) >= self.max_size:
+                now = time.monotonic()
+                self._buckets = {k: v for k, v in self._buckets.items() if not v.idle(now)}
+            b = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return b
+
+def update_kind(update) -> str | None:
+    if update.callback_query:
+        return (update.callback_query.data or "").split(":", 1)[0]
+    if update.message:
+        return "msg"
+    return None
+
+# dernier update_id reçu par (utilisateur, type) pour les types fusionnables
+_latest: dict[tuple[int, str], int] = {}
+_render_locks: dict[tuple[int, str], list] = {}  # clé -> [Lock, nb d'updates qui l'utilisent]
+
+def note_arrival(update):
+    """À appeler dès réception (avant la file du webhook) pour que les taps plus anciens soient sautés."""
+    kind = update_kind(update)
+    if kind not in COALESCE:
+        return
+    key = (update.callback_query.from_user.id, kind)
+    if update.update_id > _latest.get(key, -1):
+        _latest[key] = update.update_id
+        if len(_latest) > MAX_BUCKETS:
+            _latest.pop(next(iter(_latest)))
+
+class ThrottleMiddleware(BaseMiddleware):
+    """Middleware externe sur dp.update."""
+
+    def __init__(self):
+        self.users = BucketMap(USER_RATE, USER_BURST)
+        self.kinds = BucketMap(KIND_RATE, KIND_BURST)
+        self._deferred: dict = {}  # (utilisateur, type) -> (update, TimerHandle) du tap replanifié
+        self._tasks: set = set()
+
+    async def _drop(self, update, kind: str, reason: str):
+        THROTTLED.inc(kind, reason)
+        if update.callback_query:
+            try:
+                await update.callback_query.answer()
+            except Exception:
+                pass
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        kind = update_kind(event)
+        if not THROTTLE or user is None or kind is None:
+            return await handler(event, data)
+        note_arrival(event)
+        key = (user.id, kind)
+        if not self.users.get(user.id).take():
+            return await self._drop(event, kind, "user_rate")
+        if kind != "msg" and kind not in COALESCE and not self.kinds.get(key).take():
+            return await self._drop(event, kind, "kind_rate")
+        if kind not in COALESCE:
+            return await handler(event, data)
+        return await self._render(key, kind, handler, event, data)
+
+    async def _render(self, key, kind, handler, event, data):
+        # un seul rendu à la fois par (utilisateur, type); en attendant son tour,
+        # un tap peut être dépassé par un plus récent et n'est alors pas rendu
+        entry = _render_locks.get(key)
+        if entry is None:
+            entry = _render_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if _latest.get(key, -1) > event.update_id:
+                    return await self._drop(event, kind, "coalesced")
+                bucket = self.kinds.get(key)
+                wait = bucket.delay()
+                if wait:
+                    # trop de rendus: pas d'attente ici (le worker de la file sert aussi
+                    # d'autres chats), le tap est replanifié et ne sera rendu que s'il
+                    # est toujours le dernier
+                    self._defer(key, kind, handler, event, data, wait)
+                    return None
+                bucket.take()
+                return await handler(event, data)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del _render_locks[key]
+
+    def _defer(self, key, kind, handler, event, data, wait: float):
+        old = self._deferred.pop(key, None)
+        if old is not None:
+            old[1].cancel()  # remplacé par un tap plus récent
+            asyncio.get_running_loop().create_task(self._drop(old[0], kind, "coalesced"))
+        loop = asyncio.get_running_loop()
+
+        async def render():
+            try:
+                await self._render(key, kind, handler, event, data)
+            except Exception as e:
+                print(f"[THROTTLE] rendu différé de {kind} en échec: {e}")
+            finally:
+                state_store.flush()  # hors de la chaîne de middlewares: on flushe nous-mêmes
+
+        def fire():
+            self._deferred.pop(key, None)
+            task = loop.create_task(render())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        self._deferred[key] = (event, loop.call_later(wait, fire))
@@ -0,0 +1,86 @@
+# update_queue.py — traitement des updates Telegram hors de la requête webhook
+# Le webhook valide l'update, l'enfile et répond 200 tout de suite. Des workers
+# le passent ensuite à dp.feed_update. Chaque chat est toujours routé vers le
+# même worker (ordre conservé par chat), les files sont bornées (backpressure)
+# et les update_id déjà vus sont ignorés (redélivraisons Telegram).
+import os, asyncio, logging
+from collections import OrderedDict
+
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))   # total, réparti entre workers
+UPDATE_DEDUP_SIZE = int(os.getenv("UPDATE_DEDUP_SIZE", "10000"))
+ENQUEUE_TIMEOUT = float(os.getenv("UPDATE_ENQUEUE_TIMEOUT", "5"))
+
+def chat_key(update) -> int:
+    """Clé d'ordonnancement: chat si connu, sinon utilisateur, sinon update_id."""
+    try:
+        ev = update.event
+    except Exception:  # type d'update inconnu de cette version d'aiogram
+        return update.update_id
+    chat = getattr(ev, "chat", None) or getattr(getattr(ev, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(ev, "from_user", None)
+    if user is not None:
+        return user.id
+    return update.update_id
+
+class UpdateQueue:
+    def __init__(self, handle, workers: int = UPDATE_WORKERS, maxsize: int = UPDATE_QUEUE_SIZE,
+                 dedup_size: int = UPDATE_DEDUP_SIZE):
+        self._handle = handle  # async handle(update)
+        self._queues = [asyncio.Queue(maxsize=max(1, maxsize // workers)) for _ in range(workers)]
+        self._tasks: list[asyncio.Task] = []
+        self._seen: OrderedDict[int, None] = OrderedDict()
+        self._dedup_size = dedup_size
+
+    @property
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def is_duplicate(self, update_id: int) -> bool:
+        return update_id in self._seen
+
+    def _mark_seen(self, update_id: int):
+        self._seen[update_id] = None
+        if len(self._seen) > self._dedup_size:
+            self._seen.popitem(last=False)
+
+    async def put(self, update, timeout: float = ENQUEUE_TIMEOUT) -> bool:
+        """Enfile l'update; False si doublon. Lève asyncio.TimeoutError si la file reste pleine."""
+        if self.is_duplicate(update.update_id):
+            return False
+        q = self._queues[hash(chat_key(update)) % len(self._queues)]
+        # marqué avant l'attente: une redélivraison pendant qu'on attend une place est un doublon
+        self._mark_seen(update.update_id)
+        try:
+            await asyncio.wait_for(q.put(update), timeout)
+        except BaseException:
+            self._seen.pop(update.update_id, None)  # pas enfilé: Telegram pourra le redélivrer
+            raise
+        return True
+
+    async def _worker(self, q: asyncio.Queue):
+        while True:
+            update = await q.get()
+            try:
+                await self._handle(update)
+            except Exception as e:
+                logging.exception("Erreur pendant le traitement de l'update %s: %s", update.update_id, e)
+            finally:
+                q.task_done()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(q)) for q in self._queues]
+
+    async def stop(self, drain_timeout: float = 10):
+        """Laisse finir les updates en file (au plus drain_timeout s), puis arrête les workers."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), drain_timeout)
+        except asyncio.TimeoutError:
+            logging.warning("Arrêt: %s update(s) non traitée(s)", self.depth)
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
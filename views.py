@@ -0,0 +1,110 @@
+# views.py — ce qu'affiche chaque message du bot, pour le mettre à jour en un appel
+# On garde (image, texte, clavier) par message: une navigation devient un seul
+# edit_media (légende et clavier inclus), edit_caption ou edit_reply_markup selon
+# ce qui change réellement, et rien du tout si le message est déjà à jour.
+# L'état est dans le store partagé (storage.py), relu sans cache: avec plusieurs
+# workers, un message édité par un autre process n'est jamais sauté à tort.
+# Inconnu (expiré, autre store): on fait l'édition complète, en un appel.
+import os
+
+from aiogram.types import Message, InputMediaPhoto
+from aiogram.exceptions import TelegramBadRequest
+
+import metrics
+from media import photo_input, remember, forget, is_media_error
+from sessions import SessionMap
+
+VIEW_CACHE_SIZE = int(os.getenv("VIEW_CACHE_SIZE", "20000"))
+
+_MEDIA_TYPES = ("photo", "video", "animation", "document")
+
+# "chat:message" -> [image, texte, clavier JSON]; 48 h = délai max pour éditer un message
+_views = SessionMap("view", ttl=48 * 3600, max_entries=VIEW_CACHE_SIZE)
+
+EDITS = metrics.Counter("bot_message_edits_total", "Mises à jour de messages par appel choisi", ("call",))
+
+def _key(m: Message) -> str:
+    return f"{m.chat.id}:{m.message_id}"
+
+def _markup_json(reply_markup) -> str | None:
+    return reply_markup.model_dump_json(exclude_none=True) if reply_markup is not None else None
+
+def _current(m: Message) -> tuple | None:
+    cur = _views.fresh(_key(m))
+    return tuple(cur) if cur else None
+
+def record(m, image: str | None, text: str, reply_markup=None):
+    """Mémorise ce qu'affiche un message que le bot vient d'envoyer ou d'éditer."""
+    if not isinstance(m, Message):
+        return
+    _views[_key(m)] = [image, text, _markup_json(reply_markup)]
+
+def _not_modified(e: TelegramBadRequest) -> bool:
+    return "message is not modified" in str(e)
+
+async def _edit_media(m: Message, img: str, caption: str, reply_markup, parse_mode):
+    """edit_media via le file_id en cache, sinon l'image locale, sinon l'URL (puis on mémorise)."""
+    ref = await photo_input(img)
+    try:
+        res = await m.edit_media(InputMediaPhoto(media=ref, caption=caption, parse_mode=parse_mode),
+                                 reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if ref is img or _not_modified(e):
+            raise
+        if isinstance(ref, str) and is_media_error(e):
+            forget(img)  # file_id refusé
+        res = await m.edit_media(InputMediaPhoto(media=img, caption=caption, parse_mode=parse_mode),
+                                 reply_markup=reply_markup)
+    remember(img, res)
+    return res
+
+async def show(m: Message, text: str, image: str | None = None, reply_markup=None, parse_mode="Markdown"):
+    """Amène `m` à afficher (image, texte, clavier) avec l'appel le moins coûteux.
+
+    image=None garde le média actuel; un message texte ne peut pas devenir une photo
+    (son texte est alors édité). Lève TelegramBadRequest si l'édition est impossible.
+    """
+    cur = _current(m)
+    is_media = m.content_type in _MEDIA_TYPES
+    if not is_media:
+        image = None
+    elif image is None and cur is not None:
+        image = cur[0]
+    target = (image, text, _markup_json(reply_markup))
+    if cur == target:
+        EDITS.inc("skip")
+        return m
+    try:
+        if image and (cur is None or cur[0] != image):
+            EDITS.inc("edit_media")
+            await _edit_media(m, image, text, reply_markup, parse_mode)
+        elif cur is not None and cur[1] == text:
+            EDITS.inc("edit_reply_markup")
+            await m.edit_reply_markup(reply_markup=reply_markup)
+        elif is_media:
+            EDITS.inc("edit_caption")
+            await m.edit_caption(caption=text, parse_mode=parse_mode, reply_markup=reply_markup)
+        else:
+            EDITS.inc("edit_text")
+            await m.edit_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if not _not_modified(e):
+            raise
+    record(m, image, text, reply_markup)
+    return m
+
+async def set_markup(m: Message, reply_markup):
+    """Remplace seulement le clavier (sans appel s'il est déjà affiché)."""
+    cur = _current(m)
+    if cur is not None and cur[2] == _markup_json(reply_markup):
+        EDITS.inc("skip")
+        return m
+    EDITS.inc("edit_reply_markup")
+    try:
+        await m.edit_reply_markup(reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if not _not_modified(e):
+            raise
+    if cur is not None:
+        _views[_key(m)] = [cur[0], cur[1], _markup_json(reply_markup)]
+    return m
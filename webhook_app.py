@@ -1 +1,140 @@
-# webhook_app.py import os import logging from fastapi import FastAPI, Request, HTTPException from aiogram.types import Update from main import bot, dp, BOT_TOKEN app = FastAPI(title="Telegram Bot on Render") WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or BOT_TOKEN # idéalement définir WEBHOOK_SECRET dans Render # ---- Health / keep-alive ---- @app.get("/") async def root_get(): return {"ok": True, "service": "telegram-bot"} @app.head("/") async def root_head(): # Certains health checks (Render/proxy) envoient HEAD / return "" @app.get("/ping") async def ping_get(): return {"status": "ok"} @app.head("/ping") async def ping_head(): return "" @app.options("/ping") async def ping_options(): # Si un proxy envoie OPTIONS, on renvoie 200 return "" # ---- Webhook Telegram ---- @app.post(f"/webhook/{WEBHOOK_SECRET}") async def telegram_webhook(request: Request): try: payload = await request.json() except Exception: raise HTTPException(status_code=400, detail="Bad JSON") try: update = Update.model_validate(payload) # aiogram v3 / pydantic v2 await dp.feed_update(bot, update) except Exception as e: logging.exception("Erreur pendant le traitement du webhook: %s", e) # On évite les retries agressifs côté Telegram return {"ok": False, "error": "internal"} return {"ok": True}
+# webhook_app.py
+import time
+_T0 = time.perf_counter()  # début du démarrage (avant les imports lourds)
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, Response
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from aiogram.types import Update
+from main import bot, dp, BOT_TOKEN
+import sheets
+import images
+from update_queue import UpdateQueue
+import throttle
+import metrics
+import orders
+import sessions
+
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or BOT_TOKEN  # idéalement définir WEBHOOK_SECRET dans Render
+
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "60"))       # au-delà, on se déclare prêt quand même
+WARMUP_IMAGES = int(os.getenv("WARMUP_IMAGES", "1"))            # images préparées par catégorie
+
+# ---- Démarrage: durées par phase, prêt (/ready) une fois les caches amorcés ----
+_startup: dict[str, float] = {"import": time.perf_counter() - _T0}
+_ready = asyncio.Event()
+metrics.Gauge("startup_phase_seconds", "Durée des phases du démarrage", ("phase",),
+              fn=lambda: {(k,): round(v, 4) for k, v in _startup.items()})
+
+async def _phase(name: str, coro):
+    t0 = time.perf_counter()
+    try:
+        return await coro
+    except Exception as e:
+        print(f"[STARTUP] {name} a échoué: {e}")
+    finally:
+        _startup[name] = time.perf_counter() - t0
+
+async def _warm_caches():
+    await _phase("sheets_auth", sheets._run(sheets.warm_up))
+    catalog = await _phase("catalog", sheets.get_catalog_async(force=True))
+    if catalog is not None:
+        # ce que verront les premiers clients: le début de chaque catégorie
+        first = [p.get("image") for prods in catalog.by_category.values() for p in prods[:WARMUP_IMAGES]]
+        await _phase("images", images.prime(first, timeout=WARMUP_TIMEOUT / 2))
+    await _phase("telegram", bot.me())
+
+async def warm_up():
+    """Authentifie Sheets, charge le catalogue, prépare les premières images et la session Telegram."""
+    try:
+        await asyncio.wait_for(_warm_caches(), WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"[STARTUP] warm-up interrompu après {WARMUP_TIMEOUT:.0f}s, on sert quand même")
+    finally:
+        _startup["ready"] = time.perf_counter() - _T0
+        _ready.set()
+        print("[STARTUP] " + ", ".join(f"{k} {v:.2f}s" for k, v in _startup.items()))
+
+async def _feed(update: Update):
+    await dp.feed_update(bot, update)
+    if "first_update" not in _startup:
+        _startup["first_update"] = time.perf_counter() - _T0  # démarrage -> première réponse
+
+updates = UpdateQueue(_feed)
+metrics.WEBHOOK_QUEUE_DEPTH.set_function(lambda: updates.depth)
+metrics.Gauge("orders_pending", "Commandes journalisées pas encore écrites dans Sheets",
+              fn=orders.pending_count)
+metrics.Gauge("sessions_live", "Sessions utilisateur actives par type", ("kind",),
+              fn=lambda: {(ns,): n for ns, n in sessions.live_counts().items()})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    updates.start()
+    await dp.emit_startup(bot=bot)
+    # en arrière-plan: le port s'ouvre tout de suite, /ready passe quand les caches sont chauds
+    warm = asyncio.create_task(warm_up())
+    yield
+    if not warm.done():
+        warm.cancel()
+    await updates.stop()
+    await dp.emit_shutdown(bot=bot)
+    await bot.session.close()
+
+app = FastAPI(title="Telegram Bot on Render", lifespan=lifespan)
+
+# ---- Health / keep-alive ----
+@app.get("/")
+async def root_get():
+    return {"ok": True, "service": "telegram-bot"}
+
+@app.head("/")
+async def root_head():
+    # Certains health checks (Render/proxy) envoient HEAD /
+    return ""
+
+@app.get("/ping")
+async def ping_get():
+    return {"status": "ok"}
+
+@app.head("/ping")
+async def ping_head():
+    return ""
+
+@app.options("/ping")
+async def ping_options():
+    # Si un proxy envoie OPTIONS, on renvoie 200
+    return ""
+
+@app.get("/ready")
+async def ready_get():
+    # health check Render: pointer ici pour n'envoyer le trafic qu'une fois le warm-up terminé
+    body = {"ready": _ready.is_set(), "startup": {k: round(v, 3) for k, v in _startup.items()}}
+    return JSONResponse(body, status_code=200 if _ready.is_set() else 503)
+
+@app.head("/ready")
+async def ready_head():
+    return Response(status_code=200 if _ready.is_set() else 503)
+
+@app.get("/metrics")
+async def metrics_get():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# ---- Webhook Telegram ----
+@app.post(f"/webhook/{WEBHOOK_SECRET}")
+async def telegram_webhook(request: Request):
+    try:
+        update = Update.model_validate_json(await request.body())  # aiogram v3 / pydantic v2
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="Bad update")
+    try:
+        # Réponse immédiate: le traitement se fait dans les workers de `updates`
+        throttle.note_arrival(update)  # un tap de navigation en file sera sauté s'il est dépassé
+        await updates.put(update)
+    except asyncio.TimeoutError:
+        # file pleine: Telegram redélivrera plus tard
+        logging.warning("File d'updates pleine, update %s refusée", update.update_id)
+        raise HTTPException(status_code=503, detail="Busy")
+    return {"ok": True}